@@ -1,23 +1,88 @@
+import numpy as np
 import pandas as pd
 
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from plotly.colors import DEFAULT_PLOTLY_COLORS
 
 import pickle
 
+import joblib
+
+import lightgbm as lgb
+from sklearn.multioutput import MultiOutputRegressor
+
 import datetime
 
 import os
+import shutil
+import tempfile
+
+import sys
+
+import argparse
+
+import json
+
+import hashlib
+import gzip
+
+import logging
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import time
+
+import random
 
 from gridstatusio import GridStatusClient
 
+from flask import Response, jsonify, request
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import gdown
 
+import diskcache
+
+from filelock import FileLock
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s",
+)
+logger = logging.getLogger("ercot_forecast")
+
+# With LOG_LEVEL=DEBUG, intermediate frames go to CSV files here instead of into the log
+debug_frame_dir = os.getenv("DEBUG_FRAME_DIR")
+
+
+def log_frame(name, df, *context):
+    # Frames are only rendered at DEBUG, never at INFO in production
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if debug_frame_dir:
+        os.makedirs(debug_frame_dir, exist_ok=True)
+        file_name = "_".join([name, *map(str, context), str(os.getpid()), str(time.time_ns())]).replace(os.sep, "-")
+        path = os.path.join(debug_frame_dir, file_name + ".csv")
+        df.to_csv(path)
+        logger.debug("%s %s: %d x %d frame written to %s", name, context, df.shape[0], df.shape[1], path)
+    else:
+        logger.debug("%s %s:\n%s", name, context, df)
+
 
 ercot_username = os.getenv("ERCOT_API_USERNAME")
 ercot_password = os.getenv("ERCOT_API_PASSWORD")
@@ -30,13 +95,170 @@ gridstatus_api_key = os.getenv("GRIDSTATUS_API_KEY")
 load_path = 'https://drive.google.com/file/d/1V83wwTbIs_8EJn5aUyDmdl4mIqtKgUeC/view?usp=sharing'
 file_id = '1V83wwTbIs_8EJn5aUyDmdl4mIqtKgUeC'
 file_url = f"https://drive.google.com/uc?id={file_id}"
-local_path = "forecast_trained_models.pkl"
-
-gdown.download(file_url, local_path, quiet=False)
+local_path = os.getenv("MODEL_BUNDLE_PATH", "forecast_trained_models.pkl")
+
+model_dir = os.getenv("MODEL_DIR", "models")
+# Pins the expected bundle; without it the Drive bundle is downloaded again once the export is
+# MODEL_BUNDLE_MAX_AGE seconds old, so a retrained bundle is picked up
+model_bundle_sha256 = os.getenv("MODEL_BUNDLE_SHA256")
+model_bundle_max_age = float(os.getenv("MODEL_BUNDLE_MAX_AGE", 24 * 60 * 60))
+# Never download, serve whatever is exported in MODEL_DIR (or the bundle at MODEL_BUNDLE_PATH)
+model_offline = os.getenv("MODEL_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_model_bundle(bundle_path, root):
+    # Split the trained bundle into one artifact per unit plus a manifest, so workers only
+    # unpickle the models they actually serve. Each bundle gets its own MODEL_DIR/<sha256>/
+    # directory and MODEL_DIR/manifest.json points at the current one, so a running registry
+    # keeps loading from the export it started with when a retrained bundle arrives
+    os.makedirs(root, exist_ok=True)
+    manifest_path = os.path.join(root, "manifest.json")
+    with FileLock(manifest_path + ".lock"):
+        bundle_sha256 = file_sha256(bundle_path)
+        previous_dir = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous_dir = json.load(f).get("export_dir")
+            if previous_dir == bundle_sha256 and os.path.isdir(os.path.join(root, previous_dir)):
+                # Same bundle as exported; the manifest's mtime records when that was last checked
+                os.utime(manifest_path)
+                return
+
+        export_dir = os.path.join(root, bundle_sha256)
+        if not os.path.exists(os.path.join(export_dir, "manifest.json")):
+            # Load the pickle file
+            with open(bundle_path, "rb") as f:
+                loaded_data = pickle.load(f)
+
+            # Written to a temporary directory and renamed, so a half-written export is never served
+            tmp_dir = tempfile.mkdtemp(prefix=".export-", dir=root)
+            entries = {}
+            for key, model in loaded_data['models'].items():
+                file_name = f"{key.split('.')[0]}.joblib"
+                joblib.dump(model, os.path.join(tmp_dir, file_name))
+                entries[key] = {"file": file_name, "class": type(model).__name__}
+            write_json_atomic(os.path.join(tmp_dir, "manifest.json"), {"bundle_sha256": bundle_sha256, "models": entries})
+            shutil.rmtree(export_dir, ignore_errors=True)
+            os.rename(tmp_dir, export_dir)
+
+        write_json_atomic(manifest_path, {"bundle_sha256": bundle_sha256, "export_dir": bundle_sha256})
+        remove_old_exports(root, keep=(bundle_sha256, previous_dir))
+
+
+def remove_old_exports(root, keep):
+    # Drop exports older than the one just replaced, and temporary directories left by a crashed
+    # export; the replaced export stays for registries that were started from it
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name in keep or not os.path.isdir(path):
+            continue
+        if name.startswith(".export-") or (len(name) == 64 and all(c in "0123456789abcdef" for c in name)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def exported_bundle_is_current(root):
+    manifest_path = os.path.join(root, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    # Manifests from before per-bundle directories list the models inline and are exported again
+    if "export_dir" not in manifest or not os.path.isdir(os.path.join(root, manifest["export_dir"])):
+        return False
+    if model_bundle_sha256 is not None:
+        return manifest.get("bundle_sha256") == model_bundle_sha256
+    return model_offline or time.time() - os.path.getmtime(manifest_path) < model_bundle_max_age
+
+
+def ensure_model_bundle(bundle_path, root):
+    # Download the trained bundle at most once per host (per MODEL_BUNDLE_MAX_AGE when unpinned) and export it for the registry
+    if model_bundle_sha256 is None and not model_offline:
+        logger.warning("MODEL_BUNDLE_SHA256 is not set: serving an unpinned model bundle, re-downloaded when older than %d s",
+                       model_bundle_max_age)
+    if exported_bundle_is_current(root):
+        return
+
+    if model_offline:
+        if not os.path.exists(bundle_path):
+            raise FileNotFoundError(f"MODEL_OFFLINE is set but neither {root}/manifest.json nor {bundle_path} exists.")
+        export_model_bundle(bundle_path, root)
+        return
+
+    os.makedirs(root, exist_ok=True)
+    with FileLock(os.path.join(root, "download.lock")):
+        # Another worker may have finished the download while we waited for the lock
+        if exported_bundle_is_current(root):
+            return
+
+        # An unpinned bundle on disk may be the stale one, so it is always downloaded again
+        have_bundle = os.path.exists(bundle_path) and model_bundle_sha256 is not None and file_sha256(bundle_path) == model_bundle_sha256
+        if not have_bundle:
+            part_path = bundle_path + ".part"
+            if gdown.download(file_url, part_path, quiet=False) is None or not os.path.exists(part_path):
+                raise RuntimeError(f"Downloading the model bundle from {file_url} failed.")
+            if model_bundle_sha256 is not None and file_sha256(part_path) != model_bundle_sha256:
+                os.remove(part_path)
+                raise RuntimeError("Downloaded model bundle does not match MODEL_BUNDLE_SHA256.")
+            os.replace(part_path, bundle_path)
+
+        export_model_bundle(bundle_path, root)
+
+
+class ModelRegistry(Mapping):
+    # Read-only mapping of model key -> model, backed by the exported manifest. Models are
+    # loaded on first use with their numpy arrays memory-mapped, and only the most recently
+    # used max_loaded of them stay referenced
+    def __init__(self, root, max_loaded=32):
+        self.max_loaded = max_loaded
+        with open(os.path.join(root, "manifest.json")) as f:
+            # Resolved once, later exports into MODEL_DIR do not change what this registry serves
+            self.root = os.path.join(root, json.load(f)["export_dir"])
+        with open(os.path.join(self.root, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["bundle_sha256"][:16]
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()
+
+    def __getitem__(self, key):
+        entry = self.manifest["models"][key]
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+
+        model = joblib.load(os.path.join(self.root, entry["file"]), mmap_mode='r')
+
+        with self._lock:
+            self._loaded[key] = model
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return model
+
+    def __contains__(self, key):
+        return key in self.manifest["models"]
+
+    def __iter__(self):
+        return iter(self.manifest["models"])
+
+    def __len__(self):
+        return len(self.manifest["models"])
 
-# Load the pickle file
-with open(local_path, "rb") as f:
-    loaded_data = pickle.load(f)
 
 # with gzip.open('forecast_results.pkl.gz', 'rb') as f:
 #     loaded_data = pickle.load(f)
@@ -46,17 +268,35 @@ with open(local_path, "rb") as f:
 #     loaded_data = pickle.load(f)
 
 
-models = loaded_data['models']
+def load_model_registry():
+    ensure_model_bundle(local_path, model_dir)
+    registry = ModelRegistry(model_dir, max_loaded=int(os.getenv("MODEL_CACHE_SIZE", 32)))
+
+    # Optionally warm models before gunicorn forks so workers share them copy-on-write
+    preload = os.getenv("MODEL_PRELOAD", "")
+    if preload:
+        keys = list(registry) if preload == "all" else list(registry)[:int(preload)]
+        for key in keys:
+            registry[key]
+    return registry
+
+
+models = load_model_registry()
+
+# Identifies the trained bundle so cached forecasts are dropped when the models change
+model_version = models.version
 
 invalid_units = ['OECCS_CC2_4', 'OECCS_CC2_2', 'LOSTPI_CC1_1', 'OECCS_CC1_2', 'OECCS_CC1_4']
 
 resource_types = []
 qses = []
 units = []
+model_keys_by_unit = {}
 for u in models.keys():
     resource_types.append(u.split('.')[0].split('_', 2)[0])
     qses.append(u.split('.')[0].split('_', 2)[1])
     unit = u.split('.')[0].split('_', 2)[2]
+    model_keys_by_unit[unit] = u
     if unit not in invalid_units:
         units.append(unit)
     # units.append(u.split('.')[0].split('_', 2)[2])
@@ -67,62 +307,604 @@ for i in range(1,11):
     offer_mw_cols.append(f'qseSubmittedCurveMW{i}')
     offer_price_cols.append(f'qseSubmittedCurvePrice{i}')
 
-tomorrow_date = (datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+day_intervals = [60, 61, 62, 90, 91, 92, 120, 121, 122]
+short_day_intervals_ng = [3, 4, 5]
+short_day_intervals_houston = [1, 2, 3, 4, 5]
+hour_offsets = [0, 1, 2]
+
+# (feature name, history source, window in days, days before the delivery date the window ends)
+rolling_avg_features = [
+    ('Houston_1_day_rolling_avg', 'houston', 1, 1),
+    ('Houston_3_day_rolling_avg', 'houston', 3, 1),
+    ('NG_Price_3_day_rolling_avg', 'henry_hub', 3, 3),
+    ('Houston_60_day_rolling_avg', 'houston', 60, 1),
+    ('Houston_90_day_rolling_avg', 'houston', 90, 1),
+    ('Houston_120_day_rolling_avg', 'houston', 120, 1),
+    ('NG_Price_60_day_rolling_avg', 'henry_hub', 60, 3),
+    ('NG_Price_90_day_rolling_avg', 'henry_hub', 90, 3),
+    ('NG_Price_120_day_rolling_avg', 'henry_hub', 120, 3),
+]
+
+# Henry Hub $/MMBtu to $/MWh per resource type
+ng_heat_rates = {'CCGT90': 7000, 'SCGT90': 9000}
+
+target_cols = offer_price_cols + offer_mw_cols
+
+time_feature_cols = ['hour', 'day_of_week', 'day_of_month', 'month', 'year']
+
+# Houston load and NG price features, the same for every unit on a delivery date
+market_lag_cols = [f'houston_{day}_days_ago_{hour}_offset' for day in day_intervals for hour in hour_offsets]
+market_lag_cols += [f'houston_{day}_days_ago' for day in day_intervals + short_day_intervals_houston]
+market_lag_cols += [f'NG_Price_{day}_days_ago' for day in day_intervals + short_day_intervals_ng]
+rolling_avg_cols = [name for name, _, _, _ in rolling_avg_features]
+market_feature_cols = market_lag_cols + rolling_avg_cols
+
+offer_feature_cols = []
+for cols in (offer_price_cols, offer_mw_cols):
+    offer_feature_cols += [f'{col}_{day}_days_ago_{hour}_offset' for day in day_intervals for hour in hour_offsets for col in cols]
+    offer_feature_cols += [f'{col}_{day}_days_ago' for day in day_intervals for col in cols]
+
+# Model input columns, in the order the models were trained on
+feature_cols = time_feature_cols + market_lag_cols + offer_feature_cols + rolling_avg_cols
+market_feature_positions = [feature_cols.index(col) for col in market_feature_cols]
+offer_feature_positions = [feature_cols.index(col) for col in offer_feature_cols]
+
+def get_tomorrow_date():
+    return (datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+def normalize_date(value):
+    # Cache keys use the zero-padded form, so 2024-6-1 must become 2024-06-01; raises ValueError
+    return datetime.datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+metrics_dir = os.getenv("METRICS_DIR", os.path.join("cache", "metrics"))
+
+# Counters live on disk so gunicorn workers and background forecast jobs all add to the same totals
+metrics_store = diskcache.Cache(metrics_dir)
+
+metric_families = {
+    'stage_seconds': ('histogram', 'Time spent in each forecast pipeline stage.'),
+    'stage_errors_total': ('counter', 'Errors by pipeline stage and exception type.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result.'),
+    'upstream_requests_total': ('counter', 'Upstream HTTP requests by host and status code.'),
+    'upstream_response_bytes_total': ('counter', 'Upstream HTTP response body bytes by host.'),
+    'api_requests_total': ('counter', 'Forecast API responses by format and status code.'),
+}
+latency_buckets = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+
+def count_metric(family, labels, value=1):
+    # Metrics must never fail a forecast
+    try:
+        metrics_store.incr((family, '', tuple(labels)), value)
+    except Exception as e:
+        logger.warning("Failed to record metric %s: %s", family, e)
 
-def get_houston_loads(selected_date):
+
+def observe_latency(stage, seconds):
+    labels = (('stage', stage),)
     try:
-        USERNAME = ercot_username
-        PASSWORD = ercot_password
-        SUBSCRIPTION_KEY = ercot_api_key
-
-        # Authorization URL for signing into ERCOT Public API account
-        AUTH_URL = ("https://ercotb2c.b2clogin.com/ercotb2c.onmicrosoft.com/"
-                    "B2C_1_PUBAPI-ROPC-FLOW/oauth2/v2.0/token"
-                    "?username={username}"
-                    "&password={password}"
-                    "&grant_type=password"
-                    "&scope=openid+fec253ea-0d06-4272-a5e6-b478baeecd70+offline_access"
-                    "&client_id=fec253ea-0d06-4272-a5e6-b478baeecd70"
-                    "&response_type=id_token")
-
-        # Sign In/Authenticate
-        auth_response = requests.post(AUTH_URL.format(username=USERNAME, password=PASSWORD))
+        with metrics_store.transact():
+            first = metrics_store.incr(('stage_seconds', '_count', labels)) == 1
+            metrics_store.incr(('stage_seconds', '_sum', labels), seconds)
+            # Every bucket of a stage is written with its first observation, zero or not, so no
+            # series appears later and histogram_quantile always sees the full set of bounds
+            for bucket in latency_buckets + [float('inf')]:
+                if seconds <= bucket or first:
+                    metrics_store.incr(('stage_seconds', '_bucket', labels + (('le', bucket),)), 1 if seconds <= bucket else 0)
+    except Exception as e:
+        logger.warning("Failed to record latency of %s: %s", stage, e)
+
+
+@contextmanager
+def timed_stage(stage):
+    # Times a pipeline stage, as a `with` block or a function decorator, and counts the errors raised out of it
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        count_metric('stage_errors_total', (('stage', stage), ('type', type(e).__name__)))
+        raise
+    finally:
+        observe_latency(stage, time.perf_counter() - start)
+
+
+def format_label(key, value):
+    if key == 'le':
+        value = '+Inf' if value == float('inf') else repr(float(value))
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{key}="{value}"'
+
+
+def render_metrics():
+    # Prometheus text exposition format
+    samples = {}
+    for key in list(metrics_store.iterkeys()):
+        value = metrics_store.get(key)
+        if value is not None:
+            family, suffix, labels = key
+            samples.setdefault(family, []).append((suffix, labels, value))
+
+    lines = []
+    for family in sorted(samples):
+        kind, help_text = metric_families[family]
+        name = f"ercot_forecast_{family}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in sorted(samples[family], key=lambda sample: (sample[0], sample[1])):
+            label_text = ",".join(format_label(key, label) for key, label in labels)
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_endpoint():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+http_timeout = (float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)), float(os.getenv("HTTP_READ_TIMEOUT", 60)))
+
+
+class JitteredRetry(Retry):
+    # Full jitter on top of urllib3's exponential backoff so retrying workers don't stampede upstream
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+def make_http_session():
+    retry = JitteredRetry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared keep-alive connection pool for every upstream call
+http_session = make_http_session()
+
+
+def count_upstream(url, response):
+    host = urlparse(url).hostname
+    count_metric('upstream_requests_total', (('host', host), ('status', response.status_code)))
+    count_metric('upstream_response_bytes_total', (('host', host),), len(response.content))
+    return response
+
+
+def http_get(url, **kwargs):
+    kwargs.setdefault("timeout", http_timeout)
+    return count_upstream(url, http_session.get(url, **kwargs))
+
+
+def http_post(url, **kwargs):
+    kwargs.setdefault("timeout", http_timeout)
+    return count_upstream(url, http_session.post(url, **kwargs))
+
+
+class PooledGridStatusClient(GridStatusClient):
+    # Sends gridstatusio requests through the shared session instead of a bare requests.get
+    def _get_with_retry(self, url, params, headers, verbose=False):
+        response = http_get(url, params=params, headers=headers)
+        if response.status_code != 200:
+            raise Exception(f"Error {response.status_code}: {response.text}")
+        return response
+
+
+gridstatus_client = None
+gridstatus_client_lock = threading.Lock()
+
+
+def get_gridstatus_client():
+    global gridstatus_client
+    with gridstatus_client_lock:
+        if gridstatus_client is None:
+            gridstatus_client = PooledGridStatusClient(gridstatus_api_key)
+        return gridstatus_client
+
+
+ercot_client_id = "fec253ea-0d06-4272-a5e6-b478baeecd70"
+
+# Token endpoint for signing into ERCOT Public API account
+ercot_token_url = os.getenv("ERCOT_TOKEN_URL", "https://ercotb2c.b2clogin.com/ercotb2c.onmicrosoft.com/"
+                                               "B2C_1_PUBAPI-ROPC-FLOW/oauth2/v2.0/token")
+# Public reports base URL; both are overridable so benchmarks can run against a local stub server
+ercot_api_url = os.getenv("ERCOT_API_URL", "https://api.ercot.com/api/public-reports")
+
+
+class ErcotTokenProvider:
+    # Process-wide ERCOT access token, shared by all fetchers and refreshed
+    # with the offline_access refresh token shortly before it expires
+
+    def __init__(self, username, password, refresh_margin=300):
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        # Held for the whole token request so concurrent threads share one login;
+        # both locks are re-created in forked children by reset_after_fork
+        self._renew_lock = threading.Lock()
+        self._access_token = None
+        self._refresh_token = None
+        self._expires_at = 0.0
+
+    def _current_token(self):
+        with self._lock:
+            if self._access_token is not None and time.time() < self._expires_at - self.refresh_margin:
+                return self._access_token
+            return None
+
+    def get_token(self):
+        token = self._current_token()
+        if token is not None:
+            return token
+
+        with self._renew_lock:
+            # Another thread may have renewed the token while we waited
+            token = self._current_token()
+            if token is not None:
+                return token
+            with self._lock:
+                refresh_token = self._refresh_token
+
+            token = self._renew(refresh_token)
+            with self._lock:
+                self._access_token = token["access_token"]
+                self._refresh_token = token.get("refresh_token", self._refresh_token)
+                self._expires_at = time.time() + float(token.get("expires_in", 3600))
+                return self._access_token
+
+    def invalidate(self):
+        with self._lock:
+            self._access_token = None
+
+    def _renew(self, refresh_token):
+        if refresh_token:
+            try:
+                return self._request_token({"grant_type": "refresh_token", "refresh_token": refresh_token})
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning("ERCOT token refresh failed, signing in again: %s", e)
+        return self._request_token({"grant_type": "password", "username": self.username, "password": self.password})
+
+    @timed_stage('ercot_auth')
+    def _request_token(self, grant):
+        params = {
+            **grant,
+            "scope": f"openid {ercot_client_id} offline_access",
+            "client_id": ercot_client_id,
+            "response_type": "id_token",
+        }
+        auth_response = http_post(ercot_token_url, params=params)
         auth_response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
 
-        # Retrieve access token
-        access_token = auth_response.json().get("access_token")
-        if not access_token:
-            raise ValueError("Access token not retrieved from the authentication response (ERCOT Houston).")
+        token = auth_response.json()
+        if not token.get("access_token"):
+            raise ValueError("Access token not retrieved from the authentication response (ERCOT).")
+        return token
+
+
+ercot_tokens = ErcotTokenProvider(ercot_username, ercot_password)
+
+
+def ercot_headers():
+    return {"Authorization": "Bearer " + ercot_tokens.get_token(), "Ocp-Apim-Subscription-Key": ercot_api_key}
+
+
+def ercot_get(apiurl, params):
+    # Sign in again once if the cached token was rejected
+    response = http_get(apiurl, headers=ercot_headers(), params=params)
+    if response.status_code == 401:
+        ercot_tokens.invalidate()
+        response = http_get(apiurl, headers=ercot_headers(), params=params)
+    return response
+
+
+ercot_page_size = int(os.getenv("ERCOT_PAGE_SIZE", 50000))
+# Later pages of a report are requested in parallel; keep this within ERCOT's rate limit
+report_page_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ERCOT_PAGE_WORKERS", 4)))
+
+
+def get_ercot_report_page(apiurl, params, page):
+    response = ercot_get(apiurl, {**params, "page": page, "size": ercot_page_size})
+    response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+    return response.json()
+
+
+def report_page_columns(page, columns, report_name):
+    # Only the requested columns of a page's rows, one typed array per column;
+    # the rest of the page is dropped as soon as this returns
+    col_names = [field['name'] for field in page.get('fields', [])]
+    if 'data' not in page or not col_names:
+        raise KeyError(f"Missing required data or column names in API response ({report_name}).")
+    missing = [col for col in columns if col not in col_names]
+    if missing:
+        raise KeyError(f"Missing columns {missing} in API response ({report_name}).")
+
+    rows = page['data']
+    positions = {col: col_names.index(col) for col in columns}
+    return {
+        col: np.array([row[pos] for row in rows], dtype=object if columns[col] in ('category', 'datetime64[ns]') else columns[col])
+        for col, pos in positions.items()
+    }
+
+
+def fetch_ercot_report(apiurl, params, columns, report_name):
+    # Every page of a public report as a DataFrame of `columns` ({name: dtype}, numpy dtypes,
+    # 'datetime64[ns]' or 'category'). The first page says how many there are; the rest are fetched concurrently
+    first_page = get_ercot_report_page(apiurl, params, 1)
+    total_pages = int((first_page.get('_meta') or {}).get('totalPages') or 1)
+    pages = [report_page_columns(first_page, columns, report_name)]
+    del first_page
+
+    page_futures = [
+        report_page_executor.submit(lambda page: report_page_columns(get_ercot_report_page(apiurl, params, page), columns, report_name), page)
+        for page in range(2, total_pages + 1)
+    ]
+    pages += [future.result() for future in page_futures]
+    logger.debug("%s: %d pages retrieved for %s", report_name, total_pages, params)
+
+    return pd.DataFrame({col: np.concatenate([page[col] for page in pages]) for col in columns}).astype(columns)
+
+
+def to_days(values):
+    # Naive datetime64[ns] at midnight, whatever date format or timezone upstream used
+    days = pd.to_datetime(values)
+    if getattr(days.dtype, 'tz', None) is not None:
+        days = days.dt.tz_localize(None)
+    return days.dt.normalize().astype('datetime64[ns]')
+
 
-        apiurl = "https://api.ercot.com/api/public-reports/np6-346-cd/act_sys_load_by_fzn"
-        headers = {"Authorization": "Bearer " + access_token, "Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY}
+history_cache_dir = os.getenv("HISTORY_CACHE_DIR", os.path.join("cache", "history"))
 
+
+def contiguous_runs(days):
+    # Group sorted 'YYYY-MM-DD' strings into (first, last) ranges of consecutive days
+    runs = []
+    for day in days:
+        if runs and pd.to_datetime(day) - pd.to_datetime(runs[-1][1]) == pd.Timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+class HistoryStore:
+    # Parquet copy of fetched upstream history, one file per source. Only operating days
+    # not on disk yet are requested upstream; days published more than settle_days ago are
+    # treated as final (even if upstream had no rows for them), more recent days are fetched
+    # again. publish_lag_days is how long after a day the source publishes it (60 for offers).
+
+    def __init__(self, root, settle_days=7, max_frames=64, on_top_up=None):
+        self.root = root
+        self.settle_days = settle_days
+        self.max_frames = max_frames
+        self.on_top_up = on_top_up
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+
+    # Bumped whenever the stored dtypes change; files of older formats are ignored and refetched
+    format_version = 2
+
+    def get(self, source, date_col, day_from, day_to, fetch, publish_lag_days=0):
+        days = pd.date_range(day_from, day_to).strftime('%Y-%m-%d')
+        history, covered = self._read(source)
+        # Days past the settle cutoff are fetched again even if an older run marked them covered
+        settled = self._settled_day(publish_lag_days)
+        missing = [day for day in days if day not in covered or day > settled]
+        count_metric('cache_requests_total', (('cache', 'history_days'), ('result', 'hit')), len(days) - len(missing))
+        count_metric('cache_requests_total', (('cache', 'history_days'), ('result', 'miss')), len(missing))
+        if missing:
+            try:
+                history, covered = self._top_up(source, date_col, missing, fetch, settled)
+            except Exception as e:
+                # Keep serving what is on disk while upstream is unavailable
+                if self._slice(history, date_col, day_from, day_to).empty:
+                    raise
+                logger.warning("Serving cached %s history, upstream fetch failed: %s", source, e)
+        return self._slice(history, date_col, day_from, day_to)
+
+    def _slice(self, history, date_col, day_from, day_to):
+        # History is kept sorted by date, so a date range is two binary searches
+        if history.empty:
+            return history
+        lo = history[date_col].searchsorted(pd.Timestamp(day_from), side='left')
+        hi = history[date_col].searchsorted(pd.Timestamp(day_to), side='right')
+        return history.iloc[lo:hi].reset_index(drop=True)
+
+    def _settled_day(self, publish_lag_days):
+        return (pd.Timestamp.today().normalize() - pd.Timedelta(days=self.settle_days + publish_lag_days)).strftime('%Y-%m-%d')
+
+    def _top_up(self, source, date_col, missing, fetch, settled):
+        path = self._path(source)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with FileLock(path + ".lock"):
+            # Another worker may have filled the gap while we waited for the lock
+            history, covered = self._read(source)
+            missing = [day for day in missing if day not in covered or day > settled]
+            if not missing:
+                return history, covered
+
+            fetched = pd.concat([fetch(run_from, run_to) for run_from, run_to in contiguous_runs(missing)], ignore_index=True)
+            fetched[date_col] = to_days(fetched[date_col])
+            missing_days = pd.to_datetime(missing)
+            fetched = fetched[fetched[date_col].isin(missing_days)]
+
+            history = pd.concat([history[~history[date_col].isin(missing_days)] if not history.empty else history, fetched], ignore_index=True)
+            history = history.sort_values(by=date_col, kind='stable').reset_index(drop=True)
+            # Concatenating categoricals with different categories falls back to object
+            for col in fetched.select_dtypes('category').columns:
+                history[col] = history[col].astype('category')
+            covered = (covered - set(missing)) | {day for day in missing if day <= settled}
+
+            self._write(path, history, covered)
+            if self.on_top_up is not None:
+                self.on_top_up(source, date_col, fetched, missing)
+            return history, covered
+
+    def _path(self, source):
+        return os.path.join(self.root, f"{source}.v{self.format_version}.parquet")
+
+    def _read(self, source):
+        path = self._path(source)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return pd.DataFrame(), set()
+
+        with self._lock:
+            cached = self._frames.get(source)
+            if cached is not None and cached[0] == mtime:
+                self._frames.move_to_end(source)
+                return cached[1], cached[2]
+
+        table = pq.read_table(path)
+        covered = set(json.loads((table.schema.metadata or {}).get(b"covered_days", b"[]")))
+        history = table.to_pandas()
+
+        with self._lock:
+            self._frames[source] = (mtime, history, covered)
+            self._frames.move_to_end(source)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return history, covered
+
+    def _write(self, path, history, covered):
+        table = pa.Table.from_pandas(history, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"covered_days"] = json.dumps(sorted(covered)).encode()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+
+
+class RollingAggregateStore:
+    # Per-day totals and counts of a history source with running (prefix) sums, persisted as
+    # one Parquet file per source. Fetching a new operating day appends a row and extends the
+    # running sums from there; any trailing N-day mean is then two lookups.
+
+    def __init__(self, root, value_cols):
+        self.root = root
+        self.value_cols = value_cols  # history source -> aggregated column
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    # Bumped whenever the stored dtypes change, like HistoryStore.format_version
+    format_version = 2
+
+    def record(self, source, date_col, rows, days):
+        # Replace the aggregates of `days` with those of the freshly fetched rows
+        if source not in self.value_cols:
+            return
+        days = pd.to_datetime(days)
+        daily = rows[self.value_cols[source]].astype(float).groupby(rows[date_col]).agg(['sum', 'count'])
+        daily = daily[daily['count'] > 0].rename(columns={'sum': 'total'}).rename_axis('day').reset_index()
+
+        path = self._path(source)
+        os.makedirs(self.root, exist_ok=True)
+        with FileLock(path + ".lock"):
+            table = self._read(source)
+            table = pd.concat([table[~table['day'].isin(days)], daily], ignore_index=True) if not table.empty else daily
+            table = table.sort_values(by='day', kind='stable').reset_index(drop=True)
+
+            # Running sums before the first changed day are still valid
+            first = int(np.searchsorted(table['day'].to_numpy(), days.min().to_datetime64()))
+            for col in ('total', 'count'):
+                base = table[f'cum_{col}'].iat[first - 1] if first else 0.0
+                table.loc[first:, f'cum_{col}'] = base + table[col].iloc[first:].astype(float).cumsum()
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def seed(self, source, date_col, history):
+        # Build the aggregates from history cached before this store existed
+        if not os.path.exists(self._path(source)) and not history.empty:
+            self.record(source, date_col, history, sorted(history[date_col].unique()))
+
+    def window_mean(self, source, last_day, n_days):
+        # Mean of every value on the n_days operating days ending at last_day (inclusive)
+        return self.window_means(source, pd.DatetimeIndex([pd.Timestamp(last_day)]), n_days)[0]
+
+    def window_means(self, source, last_days, n_days):
+        # window_mean for many last days at once, NaN where a window holds no data
+        table = self._read(source)
+        if table.empty:
+            return np.full(len(last_days), np.nan)
+        days = table['day'].to_numpy()
+        last_days = pd.DatetimeIndex(last_days).to_numpy()
+        first_days = last_days - np.timedelta64(n_days - 1, 'D')
+        hi = np.searchsorted(days, last_days, side='right')
+        lo = np.searchsorted(days, first_days, side='left')
+        # Prefix sums with a leading zero, so lo == 0 needs no special case
+        cum_total = np.concatenate([[0.0], table['cum_total'].to_numpy()])
+        cum_count = np.concatenate([[0.0], table['cum_count'].to_numpy()])
+        count = cum_count[hi] - cum_count[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(hi > lo, (cum_total[hi] - cum_total[lo]) / count, np.nan)
+
+    def _path(self, source):
+        return os.path.join(self.root, f"{source}.v{self.format_version}.parquet")
+
+    def _read(self, source):
+        path = self._path(source)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return pd.DataFrame(columns=['day', 'total', 'count', 'cum_total', 'cum_count'])
+
+        with self._lock:
+            cached = self._tables.get(source)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        table = pd.read_parquet(path)
+        with self._lock:
+            self._tables[source] = (mtime, table)
+        return table
+
+
+rolling_store = RollingAggregateStore(
+    os.getenv("ROLLING_CACHE_DIR", os.path.join("cache", "rolling")),
+    {'houston': 'houston', 'henry_hub': 'price'},
+)
+history_store = HistoryStore(
+    history_cache_dir,
+    settle_days=int(os.getenv("HISTORY_SETTLE_DAYS", 7)),
+    on_top_up=rolling_store.record,
+)
+
+
+# Columns of the load report the feature builder uses
+houston_report_columns = {'operatingDay': 'datetime64[ns]', 'hourEnding': object, 'houston': 'float32'}
+
+
+@timed_stage('ercot_houston_loads')
+def fetch_houston_loads(day_from, day_to):
+    apiurl = f"{ercot_api_url}/np6-346-cd/act_sys_load_by_fzn"
+    params = {
+        "operatingDayFrom": day_from,
+        "operatingDayTo": day_to
+    }
+    houston_df = fetch_ercot_report(apiurl, params, houston_report_columns, "ERCOT Houston")
+    houston_df['hour'] = houston_df['hourEnding'].str.split(':').str[0].astype('int8')
+    return houston_df[['operatingDay', 'hour', 'houston']]
+
+
+def get_houston_loads(selected_date):
+    try:
         selected_date_obj = pd.to_datetime(selected_date)
         days_122_ago = selected_date_obj - pd.to_timedelta(122, unit='d')
         days_122_ago_str = days_122_ago.strftime('%Y-%m-%d')
         days_1_day_ago = selected_date_obj - pd.to_timedelta(1, unit='d')
         days_1_ago_str = days_1_day_ago.strftime('%Y-%m-%d')
 
-        params = {
-            "operatingDayFrom": days_122_ago_str,
-            "operatingDayTo": days_1_ago_str
-        }
-        response = requests.get(apiurl, headers=headers, params=params)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
-
-        data = response.json()
-        print("ERCOT Houston Data successfully retrieved!")
-        col_names = [field['name'] for field in data.get('fields', [])]
-        if 'data' not in data or not col_names:
-            raise KeyError("Missing required data or column names in API response (ERCOT Houston).")
-
-        houston_df = pd.DataFrame(data['data'], columns=col_names)
-        houston_df['hour'] = houston_df['hourEnding'].apply(lambda x: int(x.split(':')[0]))
-        houston_df_1 = houston_df[['operatingDay', 'hour', 'houston']]
+        houston_df_1 = history_store.get('houston', 'operatingDay', days_122_ago_str, days_1_ago_str, fetch_houston_loads)
+        rolling_store.seed('houston', 'operatingDay', houston_df_1)
         houston_df_1 = houston_df_1.sort_values(by=['operatingDay', 'hour'])
-        print("houston_df:")
-        print(houston_df_1)
-        print()
+        log_frame("houston_df", houston_df_1, selected_date)
         return houston_df_1
 
     except requests.exceptions.RequestException as e:
@@ -132,45 +914,41 @@ def get_houston_loads(selected_date):
     except Exception as e:
         error_message = f"ERCOT Houston An unexpected error occurred: {str(e)}"
     
-    print(error_message)  # Log the error message
+    logger.error(error_message)
     return {"error": error_message}
 
 
-def get_ng_prices(selected_date, resource_type):
+@timed_stage('gridstatus_ng_prices')
+def fetch_ng_prices(day_from, day_to):
+    # Fetch natural gas data; the dataset end bound is exclusive
+    ng_data = get_gridstatus_client().get_dataset(
+        dataset="eia_henry_hub_natural_gas_spot_prices_daily",
+        start=day_from,
+        end=(pd.to_datetime(day_to) + pd.to_timedelta(1, unit='d')).strftime('%Y-%m-%d')
+    )
+
+    # Ensure the required columns exist
+    if 'period' not in ng_data.columns or 'price' not in ng_data.columns:
+        raise KeyError("Missing required columns 'period' or 'price' in the dataset (Gridstatus NG).")
+
+    logger.debug("Grid Status NG data retrieved for %s to %s", day_from, day_to)
+    return pd.DataFrame({'period': to_days(ng_data['period']), 'price': ng_data['price'].astype('float32')})
+
+
+def get_ng_prices(selected_date):
+    # Henry Hub daily prices; scaled per resource type by scale_ng_prices
     try:
-        client = GridStatusClient(gridstatus_api_key)
         selected_date_obj = pd.to_datetime(selected_date)
         days_122_ago = selected_date_obj - pd.to_timedelta(122, unit='d')
         days_122_ago_str = days_122_ago.strftime('%Y-%m-%d')
         days_3_ago = selected_date_obj - pd.to_timedelta(3, unit='d')
         days_3_ago_str = days_3_ago.strftime('%Y-%m-%d')
 
-        # Fetch natural gas data
-        ng_data = client.get_dataset(
-            dataset="eia_henry_hub_natural_gas_spot_prices_daily",
-            start=days_122_ago_str,
-            end=days_3_ago_str
-        )
-
-        # Ensure the required columns exist
-        if 'period' not in ng_data.columns or 'price' not in ng_data.columns:
-            raise KeyError("Missing required columns 'period' or 'price' in the dataset (Gridstatus NG).")
-
-        ng_df = ng_data[['period', 'price']]
+        ng_df = history_store.get('henry_hub', 'period', days_122_ago_str, days_3_ago_str, fetch_ng_prices)
+        rolling_store.seed('henry_hub', 'period', ng_df)
 
-        # Perform calculations based on resource type
-        if resource_type == 'CCGT90':
-            ng_df['NG Price in Dollar Per MW'] = ng_df['price'] * 7000
-        elif resource_type == 'SCGT90':
-            ng_df['NG Price in Dollar Per MW'] = ng_df['price'] * 9000
-        else:
-            raise ValueError(f"Invalid resource type: {resource_type}. Allowed values: 'CCGT90', 'SCGT90'.")
-        
-        print("Grid Status NG data retrieved successfully!")
         ng_df = ng_df.sort_values(by='period')
-        print("ng_df:")
-        print(ng_df)
-        print()
+        log_frame("ng_df", ng_df, selected_date)
         return ng_df
 
     except KeyError as e:
@@ -180,10 +958,42 @@ def get_ng_prices(selected_date, resource_type):
     except Exception as e:
         error_message = f"Gridstatus NG An unexpected error occurred: {str(e)}"
 
-    print(error_message)  # Log the error for debugging
+    logger.error(error_message)
     return {"error": error_message}
 
 
+def scale_ng_prices(ng_df, resource_type):
+    # Perform calculations based on resource type
+    if resource_type not in ng_heat_rates:
+        raise ValueError(f"Invalid resource type: {resource_type}. Allowed values: 'CCGT90', 'SCGT90'.")
+    return ng_df.assign(**{'NG Price in Dollar Per MW': ng_df['price'] * ng_heat_rates[resource_type]})
+
+
+# The 60-day DAM resource report publishes a delivery date's offers this many days later
+offer_disclosure_days = 60
+
+# Columns of the 60-day DAM resource report the feature builder and plot titles use
+offer_report_columns = {
+    'deliveryDate': 'datetime64[ns]', 'hourEnding': 'int8',
+    'qseName': 'category', 'resourceName': 'category', 'resourceType': 'category',
+    **{col: 'float32' for col in offer_price_cols + offer_mw_cols},
+}
+
+
+@timed_stage('ercot_past_offers')
+def fetch_past_offers(day_from, day_to, selected_unit):
+    # API request for past offers
+    apiurl = f"{ercot_api_url}/np3-966-er/60_dam_gen_res_data"
+
+    params = {
+        "deliveryDateFrom": day_from,
+        "deliveryDateTo": day_to,
+        "hourEndingFrom": 1,
+        "hourEndingTo": 24,
+        "resourceName": selected_unit,
+    }
+
+    return fetch_ercot_report(apiurl, params, offer_report_columns, "ERCOT Offer")
 
 
 def get_past_offers(selected_date, selected_unit):
@@ -194,62 +1004,13 @@ def get_past_offers(selected_date, selected_unit):
         days_60_ago = selected_date_obj - pd.to_timedelta(60, unit='d')
         days_60_ago_str = days_60_ago.strftime('%Y-%m-%d')
 
-        USERNAME = ercot_username
-        PASSWORD = ercot_password
-        SUBSCRIPTION_KEY = ercot_api_key
-
-        # Authorization URL for signing into ERCOT Public API account
-        AUTH_URL = (
-            "https://ercotb2c.b2clogin.com/ercotb2c.onmicrosoft.com/"
-            "B2C_1_PUBAPI-ROPC-FLOW/oauth2/v2.0/token"
-            "?username={username}&password={password}&grant_type=password&"
-            "scope=openid+fec253ea-0d06-4272-a5e6-b478baeecd70+offline_access&"
-            "client_id=fec253ea-0d06-4272-a5e6-b478baeecd70&response_type=id_token"
+        offer_df = history_store.get(
+            f'offers/{selected_unit}', 'deliveryDate', days_122_ago_str, days_60_ago_str,
+            lambda day_from, day_to: fetch_past_offers(day_from, day_to, selected_unit),
+            publish_lag_days=offer_disclosure_days,
         )
-
-        # Authenticate and get access token
-        auth_response = requests.post(AUTH_URL.format(username=USERNAME, password=PASSWORD))
-        if auth_response.status_code != 200:
-            raise Exception(f"Authentication failed: {auth_response.text}")
-
-        access_token = auth_response.json().get("access_token")
-        if not access_token:
-            raise Exception("Failed to retrieve access token from authentication response (ERCOT offers).")
-
-        # API request for past offers
-        apiurl = "https://api.ercot.com/api/public-reports/np3-966-er/60_dam_gen_res_data"
-        headers = {
-            "Authorization": "Bearer " + access_token,
-            "Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY,
-        }
-
-        params = {
-            "deliveryDateFrom": days_122_ago_str,
-            "deliveryDateTo": days_60_ago_str,
-            "hourEndingFrom": 1,
-            "hourEndingTo": 24,
-            "resourceName": selected_unit,
-        }
-
-        response = requests.get(apiurl, headers=headers, params=params)
-        if response.status_code != 200:
-            raise Exception(f"ERCOT Offer API request failed with status code {response.status_code}: {response.text}")
-
-        # Parse data
-        data = response.json()
-        col_names = [field['name'] for field in data.get('fields', [])]
-        if 'data' not in data or not col_names:
-            raise KeyError("Missing required data or column names in API response (ERCOT Offer).")
-
-        offer_df = pd.DataFrame(data['data'], columns=col_names)
         offer_df = offer_df.sort_values(by=['deliveryDate', 'hourEnding'])
-        print("ERCOT offer data retrieved successfully!")
-        print("offer_df:")
-        print(offer_df)
-        print()
-        print('offer_df_columns:')
-        print(offer_df.columns)
-        print()
+        log_frame("offer_df", offer_df, selected_unit, selected_date)
         return offer_df
 
     except KeyError as e:
@@ -259,7 +1020,7 @@ def get_past_offers(selected_date, selected_unit):
     except Exception as e:
         error_message = f"ERCOT Offer An unexpected error occurred: {str(e)}"
 
-    print(error_message)  # Log the error for debugging
+    logger.error(error_message)
     return {"error": error_message}
 
 # def get_all_historical_data(selected_date, selected_unit):
@@ -440,366 +1201,1184 @@ def get_past_offers(selected_date, selected_unit):
 #         print(f"Exception: {error_message}")  # For debugging
 #         return {}, "", "", ""
 
-def get_all_historical_data(selected_date, selected_unit):
-    try:
-        # Initialize variables
-        day_intervals = [60, 61, 62, 90, 91, 92, 120, 121, 122]
-        short_day_intervals_ng = [3, 4, 5]
-        short_day_intervals_houston = [1, 2, 3, 4, 5]
-        hour_offsets = [0, 1, 2]
-
-        selected_date_obj = pd.to_datetime(selected_date)
-
-        # Get past offers
-        offer_df = get_past_offers(selected_date, selected_unit)
-        if "error" in offer_df:
-            raise ValueError(f"Error retrieving past offers: {offer_df['error']}")
-        
-        resource_type = list(offer_df['resourceType'].unique())[0]
-
-        # Get Houston loads
-        houston_df = get_houston_loads(selected_date)
-        if "error" in houston_df:
-            raise ValueError(f"Error retrieving Houston loads: {houston_df['error']}")
-
-        # Get NG prices
-        ng_df = get_ng_prices(selected_date, resource_type)
-        if "error" in ng_df:
-            raise ValueError(f"Error retrieving NG prices: {ng_df['error']}")
+# Upstream fetches run on this pool so one forecast waits only for its slowest source
+fetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FETCH_WORKERS", 8)))
+
+
+def reset_after_fork():
+    # Pooled sockets and executor threads must not be shared with the parent process
+    global http_session, fetch_executor, report_page_executor
+    global gridstatus_client_lock, market_contexts_lock, api_responses_lock
+    http_session = make_http_session()
+    fetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FETCH_WORKERS", 8)))
+    report_page_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ERCOT_PAGE_WORKERS", 4)))
 
-        # Extract unique values for return
-        qse = offer_df['qseName'].unique()[0]
-        print("qse:", qse)
-        r_type = offer_df['resourceType'].unique()[0]
-        print("resource type:", r_type)
-        unit = offer_df['resourceName'].unique()[0]
-        print("unit:", unit)
-
-
-
-        # Prepare input dataframe
-        input_df = pd.DataFrame({})
-        input_df['selected_date'] = [selected_date] * 24
-        input_df['selected_date'] = pd.to_datetime(input_df['selected_date'])
-        input_df['hour'] = list(range(1, 25))
-        input_df['day_of_week'] = input_df['selected_date'].dt.dayofweek + 1
-        input_df['day_of_month'] = input_df['selected_date'].dt.day
-        input_df['month'] = input_df['selected_date'].dt.month
-        input_df['year'] = input_df['selected_date'].dt.year
-
-        print("added time related features!")
-
-        # Generate historical features
-        for day in day_intervals:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            past_date = past_date.strftime('%Y-%m-%d')
-            
-            # Houston hourly offsets
-            for hour in hour_offsets:
-                col_name = f'houston_{day}_days_ago_{hour}_offset'
-                filtered = houston_df[(houston_df['operatingDay'] == past_date) & (houston_df['hour'] == hour)]
-                if not filtered.empty:
-                    input_df[col_name] = filtered['houston'].values
-                else:
-                    input_df[col_name] = None
-        
-        print("added houston hourly lags")
-
-        # Houston daily averages
-        grouped_houston = houston_df.groupby('operatingDay', as_index=False)['houston'].mean()
-        for day in day_intervals + short_day_intervals_houston:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            past_date = past_date.strftime('%Y-%m-%d')
-            col_name = f'houston_{day}_days_ago'
-            if past_date in grouped_houston['operatingDay'].values:
-                input_df[col_name] = grouped_houston.loc[grouped_houston['operatingDay'] == past_date, 'houston'].values[0]
-            else:
-                input_df[col_name] = None
-        
-        print("added houston daily lags")
-
-        # NG prices
-        grouped_ng = ng_df.groupby('period', as_index=False)['NG Price in Dollar Per MW'].mean()
-        for day in day_intervals + short_day_intervals_ng:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            past_date = past_date.strftime('%Y-%m-%d')
-            col_name = f'NG_Price_{day}_days_ago'
-            if past_date in grouped_ng['period'].values:
-                input_df[col_name] = grouped_ng.loc[grouped_ng['period'] == past_date, 'NG Price in Dollar Per MW'].values[0]
-            else:
-                input_df[col_name] = None
-        
-        print("added ng price daily lags")
+    # A lock another parent thread held at fork time stays held forever in the child
+    gridstatus_client_lock = threading.Lock()
+    market_contexts_lock = threading.Lock()
+    api_responses_lock = threading.Lock()
+    for owner in (ercot_tokens, models, history_store, rolling_store):
+        owner._lock = threading.Lock()
+    ercot_tokens._renew_lock = threading.Lock()
 
-        
-        for day in day_intervals:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            print("past date obj:", past_date)
-            past_date = past_date.strftime('%Y-%m-%d')
-            print("past date str:", past_date)
-            for hour in hour_offsets:
-                for col in offer_price_cols:
-                    col_name = f'{col}_{day}_days_ago_{hour}_offset'
-                    if past_date in offer_df['deliveryDate'].values:
-                        print("past date exists in the offer df")
-                        filtered_data = offer_df[(offer_df['deliveryDate'] == past_date) & (offer_df['hourEnding'] == hour)]
-                        if not filtered_data.empty:
-                            print("adding data")
-                            input_df[col_name] = filtered_data[col].values[0]
-                            print("added data")
-                        else:
-                            input_df[col_name] = None
-                            print("added none")
-                    else:
-                        input_df[col_name] = None
-                        print("added none")
-        
-        print("added offer price hourly data")
-        
-        for day in day_intervals:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            print("past date obj:", past_date)
-            past_date = past_date.strftime('%Y-%m-%d')
-            print("past date str:", past_date)
-            for col in offer_price_cols:
-                col_name = f'{col}_{day}_days_ago'
-                grouped_df = offer_df.groupby('deliveryDate', as_index=False)[col].mean()
-                if past_date in grouped_df['deliveryDate'].values:
-                    input_df[col_name] = grouped_df.loc[grouped_df['deliveryDate'] == past_date, col].values[0]
-                else:
-                    input_df[col_name] = None
-        
-        print("added offer price daily data")
 
-        
-        for day in day_intervals:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            past_date = past_date.strftime('%Y-%m-%d')
-            for hour in hour_offsets:
-                for col in offer_mw_cols:
-                    col_name = f'{col}_{day}_days_ago_{hour}_offset'
-                    if past_date in offer_df['deliveryDate'].values:
-                        filtered_data = offer_df[(offer_df['deliveryDate'] == past_date) & (offer_df['hourEnding'] == hour)]
-                        if not filtered_data.empty:
-                            input_df[col_name] = filtered_data[col].values[0]
-                        else:
-                            input_df[col_name] = None
-                    else:
-                        input_df[col_name] = None
-        
-        print("added offer mw hourly data")
-        
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def pivot_by_date(df, date_col, value_cols, hour_col=None):
+    # Pivot a fetched frame once into arrays indexed by position in `dates`;
+    # the extra trailing row is all NaN so a missing date (-1 from get_indexer) reads as NaN
+    values = df[value_cols].to_numpy(dtype=float)
+    date_values, codes = np.unique(df[date_col].to_numpy(), return_inverse=True)
+    dates = pd.DatetimeIndex(date_values)
+
+    # Daily means of the non-missing values
+    present = ~np.isnan(values)
+    totals = np.zeros((len(dates), len(value_cols)))
+    counts = np.zeros((len(dates), len(value_cols)))
+    np.add.at(totals, codes, np.where(present, values, 0.0))
+    np.add.at(counts, codes, present)
+    daily = np.full((len(dates) + 1, len(value_cols)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily[:-1] = totals / counts
+
+    hourly = None
+    if hour_col is not None:
+        hourly = np.full((len(dates) + 1, 25, len(value_cols)), np.nan)
+        hours = df[hour_col].to_numpy().astype(int)
+        keep = (hours >= 0) & (hours <= 24)
+        # First row of each (date, hour)
+        _, first = np.unique(codes[keep] * 25 + hours[keep], return_index=True)
+        rows = np.flatnonzero(keep)[first]
+        hourly[codes[rows], hours[rows]] = values[rows]
+
+    return dates, daily, hourly
 
-        for day in day_intervals:
-            past_date = selected_date_obj - pd.to_timedelta(day, unit='d')
-            past_date = past_date.strftime('%Y-%m-%d')
-            for col in offer_mw_cols:
-                col_name = f'{col}_{day}_days_ago'
-                grouped_df = offer_df.groupby('deliveryDate', as_index=False)[col].mean()
-                if past_date in grouped_df['deliveryDate'].values:
-                    input_df[col_name] = grouped_df.loc[grouped_df['deliveryDate'] == past_date, col].values[0]
-                else:
-                    input_df[col_name] = None
-        
-        print("added offer mw daily data")
 
-        # Rolling averages
-        input_df['Houston_1_day_rolling_avg'] = houston_df['houston'].rolling(window=24).mean()
-        input_df['Houston_3_day_rolling_avg'] = houston_df['houston'].rolling(window=72).mean()
-        input_df['NG_Price_3_day_rolling_avg'] = ng_df['NG Price in Dollar Per MW'].rolling(window=3).mean()
+def past_date_positions(dates, selected_dates, days):
+    # Position in dates of each selected date minus each of days, -1 where missing: (selected dates, days)
+    targets = pd.DatetimeIndex(selected_dates).to_numpy()[:, None] - np.array(days, dtype='timedelta64[D]')
+    return dates.get_indexer(targets.ravel()).reshape(targets.shape)
+
+
+def build_market_feature_matrix(selected_dates, resource_type, houston_df, ng_df):
+    # Houston hourly and daily lags, NG price daily lags and rolling averages, in market_feature_cols order.
+    # One row per selected date, so a backtest builds every date from one pivot of the history
+    selected_dates = pd.DatetimeIndex(selected_dates)
+    n_dates = len(selected_dates)
+
+    houston_dates, houston_daily, houston_hourly = pivot_by_date(houston_df, 'operatingDay', ['houston'], hour_col='hour')
+    ng_dates, ng_daily, _ = pivot_by_date(ng_df, 'period', ['NG Price in Dollar Per MW'])
+
+    # Rolling averages are read from the running sums rather than recomputed from the history
+    rolling_scale = {'houston': 1, 'henry_hub': ng_heat_rates.get(resource_type, np.nan)}
+    rolling_avgs = np.column_stack([
+        rolling_store.window_means(source, selected_dates - pd.to_timedelta(lag, unit='d'), window) * rolling_scale[source]
+        for _, source, window, lag in rolling_avg_features
+    ])
+
+    return np.concatenate([
+        houston_hourly[past_date_positions(houston_dates, selected_dates, day_intervals)][:, :, hour_offsets, 0].reshape(n_dates, -1),
+        houston_daily[past_date_positions(houston_dates, selected_dates, day_intervals + short_day_intervals_houston), 0],
+        ng_daily[past_date_positions(ng_dates, selected_dates, day_intervals + short_day_intervals_ng), 0],
+        rolling_avgs,
+    ], axis=1)
+
+
+@timed_stage('market_features')
+def build_market_features(selected_date, resource_type, houston_df, ng_df):
+    return build_market_feature_matrix([pd.to_datetime(selected_date)], resource_type, houston_df, ng_df)[0]
+
+
+def pivot_offers(offer_df):
+    return pivot_by_date(offer_df, 'deliveryDate', offer_price_cols + offer_mw_cols, hour_col='hourEnding')
+
+
+def build_offer_feature_matrix(selected_dates, offer_pivot):
+    # Offer price and MW lags, (day, hour offset, column) in offer_feature_cols order, one row per selected date
+    offer_dates, offer_daily, offer_hourly = offer_pivot
+    n_dates = len(selected_dates)
+
+    offer_pos = past_date_positions(offer_dates, selected_dates, day_intervals)
+    blocks = []
+    for cols in (slice(0, len(offer_price_cols)), slice(len(offer_price_cols), None)):
+        blocks.append(offer_hourly[offer_pos][:, :, hour_offsets][..., cols].reshape(n_dates, -1))
+        blocks.append(offer_daily[offer_pos][..., cols].reshape(n_dates, -1))
+    return np.concatenate(blocks, axis=1)
+
+
+def build_offer_features(selected_date, offer_df):
+    return build_offer_feature_matrix([pd.to_datetime(selected_date)], pivot_offers(offer_df))[0]
+
+
+def build_feature_matrix(selected_dates, offer_features, market_features):
+    # Model inputs for every hour of every selected date, date-major: (dates x 24, feature_cols)
+    selected_dates = pd.DatetimeIndex(selected_dates)
+
+    features = np.empty((len(selected_dates), 24, len(feature_cols)))
+    # Time related features
+    features[:, :, 0] = np.arange(1, 25)
+    features[:, :, 1] = (selected_dates.dayofweek + 1).to_numpy()[:, None]
+    features[:, :, 2] = selected_dates.day.to_numpy()[:, None]
+    features[:, :, 3] = selected_dates.month.to_numpy()[:, None]
+    features[:, :, 4] = selected_dates.year.to_numpy()[:, None]
+    features[:, :, market_feature_positions] = market_features[:, None, :]
+    features[:, :, offer_feature_positions] = offer_features[:, None, :]
+    return features.reshape(-1, len(feature_cols))
+
+
+@timed_stage('features')
+def build_features(selected_date, offer_df, market_features):
+    selected_dates = pd.DatetimeIndex([pd.to_datetime(selected_date)])
+    features = build_feature_matrix(
+        selected_dates,
+        build_offer_feature_matrix(selected_dates, pivot_offers(offer_df)),
+        np.asarray(market_features)[None, :],
+    )
+
+    index = pd.DatetimeIndex(selected_dates.repeat(24), name='selected_date')
+    return pd.DataFrame(features, columns=feature_cols, index=index)
+
+
+market_context_ttl = int(os.getenv("MARKET_CONTEXT_TTL", 60 * 60))
+market_contexts = OrderedDict()
+market_contexts_lock = threading.Lock()
+
+
+def get_market_context(selected_date):
+    # Market features for a delivery date, one row per resource type (CCGT90 and SCGT90 heat rates).
+    # Built once and reused by every unit: in-process, and across workers via the forecast cache
+    now = time.time()
+    with market_contexts_lock:
+        cached = market_contexts.get(selected_date)
+        if cached is not None and cached[0] > now:
+            count_metric('cache_requests_total', (('cache', 'market_context'), ('result', 'memory_hit')))
+            return cached[1]
 
-        print("added short term moving avgs")
+    key = ('market', selected_date)
+    context = forecast_cache.get(key)
+    count_metric('cache_requests_total', (('cache', 'market_context'), ('result', 'miss' if context is None else 'disk_hit')))
+    if context is None:
+        # The Henry Hub history is read once and scaled by each resource type's heat rate
+        houston_future = fetch_executor.submit(get_houston_loads, selected_date)
+        ng_df = get_ng_prices(selected_date)
+
+        houston_df = houston_future.result()
+        if "error" in houston_df:
+            return {"error": f"Error retrieving Houston loads: {houston_df['error']}"}
+        if "error" in ng_df:
+            return {"error": f"Error retrieving NG prices: {ng_df['error']}"}
+        context = {
+            resource_type: build_market_features(selected_date, resource_type, houston_df, scale_ng_prices(ng_df, resource_type))
+            for resource_type in ng_heat_rates
+        }
+        forecast_cache.set(key, context, expire=market_context_ttl)
 
-        input_df['Houston_60_day_rolling_avg'] = houston_df['houston'].rolling(window=1440).mean()
-        input_df['Houston_90_day_rolling_avg'] = houston_df['houston'].rolling(window=2160).mean()
-        input_df['Houston_120_day_rolling_avg'] = houston_df['houston'].rolling(window=2880).mean()
+    with market_contexts_lock:
+        market_contexts[selected_date] = (now + market_context_ttl, context)
+        market_contexts.move_to_end(selected_date)
+        while len(market_contexts) > 16:
+            market_contexts.popitem(last=False)
+    return context
 
-        # input_df['Houston_60_day_rolling_avg'] = None
-        # input_df['Houston_90_day_rolling_avg'] = None
-        # input_df['Houston_120_day_rolling_avg'] = None
 
+@timed_stage('historical_data')
+def get_all_historical_data(selected_date, selected_unit, market_context=None, progress=None):
+    try:
+        if selected_unit not in model_keys_by_unit:
+            raise ValueError(f"No model found for unit {selected_unit}.")
+        resource_type = model_keys_by_unit[selected_unit].split('_', 2)[0]
+
+        if progress is not None:
+            progress("Fetching past offers and market data...")
+
+        # Fetch past offers while the shared market features are looked up
+        offer_future = fetch_executor.submit(get_past_offers, selected_date, selected_unit)
+        if market_context is None:
+            market_context = get_market_context(selected_date)
+        if "error" in market_context:
+            raise ValueError(market_context['error'])
+        if resource_type not in market_context:
+            raise ValueError(f"Invalid resource type: {resource_type}. Allowed values: 'CCGT90', 'SCGT90'.")
 
-        print("added houston rolling avgs")
+        offer_df = offer_future.result()
+        if "error" in offer_df:
+            raise ValueError(f"Error retrieving past offers: {offer_df['error']}")
 
-        input_df['NG_Price_60_day_rolling_avg'] = ng_df['NG Price in Dollar Per MW'].rolling(window=60).mean()
-        input_df['NG_Price_90_day_rolling_avg'] = ng_df['NG Price in Dollar Per MW'].rolling(window=90).mean()
-        input_df['NG_Price_120_day_rolling_avg'] = ng_df['NG Price in Dollar Per MW'].rolling(window=120).mean()
+        # Extract unique values for return
+        qse = offer_df['qseName'].unique()[0]
+        r_type = offer_df['resourceType'].unique()[0]
+        unit = offer_df['resourceName'].unique()[0]
+        logger.debug("qse: %s, resource type: %s, unit: %s", qse, r_type, unit)
 
-        print("added ng price moving avgs")
+        if progress is not None:
+            progress("Building features...")
+        input_df = build_features(selected_date, offer_df, market_context[resource_type])
 
-        print("input_df:")
-        print(input_df)
+        log_frame("input_df", input_df, selected_unit, selected_date)
 
         return input_df, qse, r_type, unit
 
     except ValueError as e:
-        print(f"ValueError: {str(e)}")
+        logger.error("ValueError building inputs for %s on %s: %s", selected_unit, selected_date, e)
+        count_metric('stage_errors_total', (('stage', 'historical_data'), ('type', type(e).__name__)))
         return {}, "", "", ""
 
     except Exception as e:
-        print(f"Exception: {str(e)}")
+        logger.exception("Error building inputs for %s on %s: %s", selected_unit, selected_date, e)
+        count_metric('stage_errors_total', (('stage', 'historical_data'), ('type', type(e).__name__)))
         return {}, "", "", ""
 
-# Function to enforce monotonicity row-wise for a list of columns
-def enforce_monotonicity(row, columns):
-    for i in range(1, len(columns)):
-        # Ensure each column value is at least as large as the previous column's value
-        row[columns[i]] = max(row[columns[i]], row[columns[i - 1]])
-    return row
+# Enforce non-decreasing offer curves: each price/MW step is at least as large as the previous one.
+# Works on raw prediction arrays of shape (..., price steps + MW steps), e.g. hours x targets
+# for one unit or units x hours x targets for a batch
+def enforce_monotonicity(predictions):
+    predictions = np.array(predictions, dtype=float)
+    n_price = len(offer_price_cols)
+    predictions[..., :n_price] = np.fmax.accumulate(predictions[..., :n_price], axis=-1)
+    predictions[..., n_price:] = np.fmax.accumulate(predictions[..., n_price:], axis=-1)
+    return predictions
+
+def predict_with_threads(model, features, num_threads=None):
+    # LightGBM estimators, bare or wrapped in MultiOutputRegressor, predict with num_threads threads for
+    # this call only; registry models are shared, so their n_jobs is left alone
+    if not num_threads:
+        return model.predict(features)
+
+    def predict_one(estimator):
+        if isinstance(estimator, lgb.LGBMModel):
+            return estimator.predict(features, num_threads=num_threads)
+        return estimator.predict(features)
+
+    # Only MultiOutputRegressor holds one estimator per target; forests and bagging models
+    # also have estimators_, but theirs are averaged by their own predict
+    if isinstance(model, MultiOutputRegressor):
+        return np.column_stack([predict_one(estimator) for estimator in model.estimators_])
+    return predict_one(model)
+
+
+@timed_stage('model_predict')
+def predict_model(model_name, inputs, num_threads=None):
+    # Score every (input_df, qse, r_type) of one model in a single predict call on a contiguous array
+    if model_name not in models:
+        raise KeyError(f"Model '{model_name}' not found in models dictionary.")
+    model = models[model_name]
+
+    features = np.ascontiguousarray(np.vstack([input_df.to_numpy(dtype=float) for input_df, _, _ in inputs]))
+    predictions = enforce_monotonicity(predict_with_threads(model, pd.DataFrame(features, columns=feature_cols, copy=False), num_threads))
+
+    results = []
+    start = 0
+    for input_df, qse, r_type in inputs:
+        predictions_df = pd.DataFrame(predictions[start:start + len(input_df)], columns=target_cols, index=input_df.index)
+        results.append((predictions_df, qse, r_type, "no_error"))
+        start += len(input_df)
+    return results
+
 
 # Example placeholder functions for get_predictions and plot_forecasts
-def get_predictions(selected_unit, selected_date):
+@timed_stage('predictions')
+def get_predictions(selected_unit, selected_date, market_context=None, progress=None):
     try:
-        input_df, qse, r_type, unit = get_all_historical_data(selected_date, selected_unit)
+        input_df, qse, r_type, unit = get_all_historical_data(selected_date, selected_unit, market_context, progress)
         model_name = f'{r_type}_{qse}_{unit}.csv'
-        if model_name not in models:
-            raise KeyError(f"Model '{model_name}' not found in models dictionary.")
-        model = models[model_name]
-        target_cols = []
-        target_cols.extend(offer_price_cols)
-        target_cols.extend(offer_mw_cols)
-        input_df = input_df.set_index('selected_date')
-        for col in input_df.select_dtypes(include='object').columns:
-            input_df[col] = pd.to_numeric(input_df[col], errors='coerce')
-        predictions = model.predict(input_df)
-        predictions_df = pd.DataFrame(predictions, columns=target_cols, index=input_df.index)
-        predictions_df[offer_price_cols] = predictions_df[offer_price_cols].apply(lambda row: enforce_monotonicity(row, offer_price_cols), axis=1)
-        predictions_df[offer_mw_cols] = predictions_df[offer_mw_cols].apply(lambda row: enforce_monotonicity(row, offer_mw_cols), axis=1)
-        print("predictions_df")
-        print(predictions_df)
-        return predictions_df, qse, r_type, "no_error"
+        if progress is not None:
+            progress("Running the model...")
+        predictions_df, qse, r_type, error_message = predict_model(model_name, [(input_df, qse, r_type)])[0]
+        log_frame("predictions_df", predictions_df, selected_unit, selected_date)
+        return predictions_df, qse, r_type, error_message
     except KeyError as ke:
-        print(f"KeyError: {ke}")
+        logger.error("KeyError: %s", ke)
+        count_metric('stage_errors_total', (('stage', 'predictions'), ('type', 'KeyError')))
         return pd.DataFrame(), None, None, f"Error: {ke}"
     except Exception as e:
-        print(f"An error occurred in get_predictions: {e}")
+        logger.exception("An error occurred in get_predictions: %s", e)
+        count_metric('stage_errors_total', (('stage', 'predictions'), ('type', type(e).__name__)))
         return pd.DataFrame(), None, None, f"Error: {e}"
 
+
+def predict_batch(pairs, max_workers=None, num_threads=None):
+    # Forecast many (unit, date) pairs at once: market data is fetched once per date, and each
+    # unit's model is called once for all of its requested dates. Returns {(unit, date): result}
+    # with results shaped like get_predictions
+    max_workers = max_workers or int(os.getenv("PREDICT_WORKERS", 4))
+    num_threads = num_threads or max(1, (os.cpu_count() or 1) // max_workers)
+
+    results = {}
+    pairs = list(dict.fromkeys(pairs))
+    for unit, date in pairs:
+        if unit not in model_keys_by_unit:
+            results[(unit, date)] = (pd.DataFrame(), None, None, f"Error: No model found for unit {unit}.")
+    pairs = [pair for pair in pairs if pair not in results]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Houston load and NG features are the same for every unit on a date
+        dates = sorted({date for _, date in pairs})
+        market_contexts_by_date = dict(zip(dates, pool.map(get_market_context, dates)))
+
+        input_futures = {
+            pair: pool.submit(get_all_historical_data, pair[1], pair[0], market_contexts_by_date[pair[1]])
+            for pair in pairs
+        }
+
+        groups = {}
+        for pair, future in input_futures.items():
+            input_df, qse, r_type, unit = future.result()
+            if not qse:
+                results[pair] = (pd.DataFrame(), None, None, f"Error: Could not build model inputs for unit {pair[0]} on {pair[1]}.")
+                continue
+            groups.setdefault(f'{r_type}_{qse}_{unit}.csv', []).append((pair, (input_df, qse, r_type)))
+
+        predict_futures = {
+            pool.submit(predict_model, model_name, [inputs for _, inputs in members], num_threads): members
+            for model_name, members in groups.items()
+        }
+        for future, members in predict_futures.items():
+            try:
+                for (pair, _), result in zip(members, future.result()):
+                    results[pair] = result
+            except Exception as e:
+                logger.exception("An error occurred in predict_batch: %s", e)
+                for pair, _ in members:
+                    results[pair] = (pd.DataFrame(), None, None, f"Error: {e}")
+
+    return results
+
+
+forecast_cache_dir = os.getenv("FORECAST_CACHE_DIR", os.path.join("cache", "forecasts"))
+forecast_cache_ttl = int(os.getenv("FORECAST_CACHE_TTL", 24 * 60 * 60))
+
+# Shared by all gunicorn workers on the host; least recently used forecasts are evicted first
+forecast_cache = diskcache.Cache(
+    forecast_cache_dir,
+    size_limit=int(os.getenv("FORECAST_CACHE_SIZE", 1024 ** 3)),
+    eviction_policy='least-recently-used',
+)
+
+
+def forecast_cache_key(selected_unit, selected_date):
+    return ('forecast', selected_unit, selected_date, model_version)
+
+
+def get_cached_predictions(selected_unit, selected_date, progress=None):
+    key = forecast_cache_key(selected_unit, selected_date)
+    cached = forecast_cache.get(key)
+    count_metric('cache_requests_total', (('cache', 'forecast'), ('result', 'miss' if cached is None else 'hit')))
+    if cached is None:
+        # Only one worker computes a given forecast, the others wait and read its result
+        with diskcache.Lock(forecast_cache, ('lock',) + key, expire=600):
+            cached = forecast_cache.get(key)
+            if cached is None:
+                predictions_df, qse, r_type, error_message = get_predictions(selected_unit, selected_date, progress=progress)
+                if error_message != "no_error":
+                    return predictions_df, qse, r_type, error_message
+                cached = (predictions_df, qse, r_type)
+                forecast_cache.set(key, cached, expire=forecast_cache_ttl)
+
+    predictions_df, qse, r_type = cached
+    return predictions_df.copy(), qse, r_type, "no_error"
+
+def precompute_unit_forecast(selected_unit, selected_date, market_context):
+    predictions_df, qse, r_type, error_message = get_predictions(selected_unit, selected_date, market_context)
+    if error_message == "no_error":
+        forecast_cache.set(forecast_cache_key(selected_unit, selected_date), (predictions_df, qse, r_type), expire=forecast_cache_ttl)
+        fig, plot_error = plot_forecasts(selected_unit, selected_date, predictions_df, r_type, qse)
+        if plot_error == "no_error":
+            forecast_cache.set(figure_cache_key(selected_unit, selected_date), fig, expire=forecast_cache_ttl)
+    return error_message
+
+
+def precompute_forecasts(selected_date, selected_units=None, workers=None):
+    # Score every unit for a delivery date into the forecast cache so the callbacks only read
+    selected_units = selected_units or units
+
+    # Houston load and NG features are the same for every unit, so they are built once
+    market_context = get_market_context(selected_date)
+    if "error" in market_context:
+        return {unit: f"Error: {market_context['error']}" for unit in selected_units}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for unit in selected_units:
+            if unit not in model_keys_by_unit:
+                results[unit] = f"Error: No model found for unit {unit}."
+                continue
+            futures[pool.submit(precompute_unit_forecast, unit, selected_date, market_context)] = unit
+
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                results[unit] = future.result()
+            except Exception as e:
+                results[unit] = f"Error: {e}"
+            logger.info("%s: %s", unit, results[unit])
+
+    return results
+
+
+backtest_metric_cols = ['price_mae', 'mw_mae', 'curve_mae', 'capacity_error']
+
+
+def nan_mean(values, axis=-1):
+    # Mean over the non-NaN values along axis, NaN (without a warning) where there are none
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=axis)
+    total = np.where(valid, values, 0.0).sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def fill_curve_steps(steps):
+    # Repeat the last submitted point over unused (NaN) steps, so short curves end flat
+    positions = np.where(np.isnan(steps), 0, np.arange(steps.shape[-1]))
+    return np.take_along_axis(steps, np.maximum.accumulate(positions, axis=-1), axis=-1)
+
+
+def interp_curves(x, xp, fp):
+    # np.interp along the last axis for stacks of curves: x is (..., points), xp and fp are (..., steps)
+    idx = np.clip((xp[..., None, :] <= x[..., :, None]).sum(axis=-1) - 1, 0, xp.shape[-1] - 2)
+    x0, x1 = np.take_along_axis(xp, idx, axis=-1), np.take_along_axis(xp, idx + 1, axis=-1)
+    f0, f1 = np.take_along_axis(fp, idx, axis=-1), np.take_along_axis(fp, idx + 1, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(x1 > x0, np.clip((x - x0) / (x1 - x0), 0, 1), (x >= x1).astype(float))
+    return f0 + t * (f1 - f0)
+
+
+def offer_curve_metrics(predicted, actual, grid_points=32):
+    # Distances between predicted and submitted offer curves, arrays of shape (..., price steps + MW steps).
+    # price_mae/mw_mae compare step by step; curve_mae is the mean price gap between the two
+    # piecewise-linear curves over their combined MW range; capacity_error compares the last MW point
+    n_price = len(offer_price_cols)
+    pred_price, pred_mw = predicted[..., :n_price], predicted[..., n_price:]
+    actual_price, actual_mw = fill_curve_steps(actual[..., :n_price]), fill_curve_steps(actual[..., n_price:])
+
+    lo = np.fmin(pred_mw[..., 0], actual_mw[..., 0])
+    hi = np.fmax(pred_mw[..., -1], actual_mw[..., -1])
+    grid = lo[..., None] + (hi - lo)[..., None] * np.linspace(0, 1, grid_points)
+    curve_gap = np.abs(interp_curves(grid, pred_mw, pred_price) - interp_curves(grid, actual_mw, actual_price))
+
+    return {
+        'price_mae': nan_mean(np.abs(pred_price - actual[..., :n_price])),
+        'mw_mae': nan_mean(np.abs(pred_mw - actual[..., n_price:])),
+        'curve_mae': nan_mean(curve_gap),
+        'capacity_error': np.abs(pred_mw[..., -1] - actual_mw[..., -1]),
+    }
+
+
+@timed_stage('backtest_unit')
+def backtest_unit(selected_unit, selected_dates, market_features, num_threads=None):
+    # Score one unit on every selected date and compare with the offers it actually submitted.
+    # The unit's offer history is read once for the whole span, and features for all dates
+    # come from one pivot of it; market_features holds the matrices for every resource type
+    selected_dates = pd.DatetimeIndex(selected_dates)
+    model_name = model_keys_by_unit[selected_unit]
+    resource_type = model_name.split('_', 2)[0]
+
+    day_from = (selected_dates.min() - pd.to_timedelta(122, unit='d')).strftime('%Y-%m-%d')
+    day_to = selected_dates.max().strftime('%Y-%m-%d')
+    offer_df = history_store.get(
+        f'offers/{selected_unit}', 'deliveryDate', day_from, day_to,
+        lambda day_from, day_to: fetch_past_offers(day_from, day_to, selected_unit),
+        publish_lag_days=offer_disclosure_days,
+    )
+    offer_pivot = pivot_offers(offer_df)
+
+    features = build_feature_matrix(selected_dates, build_offer_feature_matrix(selected_dates, offer_pivot), market_features[resource_type])
+    input_df = pd.DataFrame(features, columns=feature_cols, index=selected_dates.repeat(24))
+    predictions_df = predict_model(model_name, [(input_df, None, resource_type)], num_threads)[0][0]
+    predicted = predictions_df.to_numpy().reshape(len(selected_dates), 24, -1)
+
+    # Submitted curves for hour endings 1-24 of each delivery date, NaN where nothing was published
+    offer_dates, _, offer_hourly = offer_pivot
+    actual = offer_hourly[offer_dates.get_indexer(selected_dates)][:, 1:25]
+
+    metrics = offer_curve_metrics(predicted, actual)
+    return pd.DataFrame({
+        'unit': selected_unit,
+        'deliveryDate': selected_dates.repeat(24),
+        'hourEnding': np.tile(np.arange(1, 25, dtype='int8'), len(selected_dates)),
+        **{col: metrics[col].ravel().astype('float32') for col in backtest_metric_cols},
+    })
+
+
+def build_backtest_market_features(selected_dates):
+    # Market feature matrices for every selected date and resource type, from one read of each history
+    day_from = (selected_dates.min() - pd.to_timedelta(122, unit='d')).strftime('%Y-%m-%d')
+    houston_df = history_store.get('houston', 'operatingDay', day_from,
+                                   (selected_dates.max() - pd.to_timedelta(1, unit='d')).strftime('%Y-%m-%d'), fetch_houston_loads)
+    rolling_store.seed('houston', 'operatingDay', houston_df)
+    ng_df = history_store.get('henry_hub', 'period', day_from,
+                              (selected_dates.max() - pd.to_timedelta(3, unit='d')).strftime('%Y-%m-%d'), fetch_ng_prices)
+    rolling_store.seed('henry_hub', 'period', ng_df)
+
+    return {
+        resource_type: build_market_feature_matrix(
+            selected_dates, resource_type, houston_df, scale_ng_prices(ng_df, resource_type)
+        )
+        for resource_type in ng_heat_rates
+    }
+
+
+def run_backtest(date_from, date_to, selected_units=None, workers=None):
+    # Backtest every unit over a range of past delivery dates, one process per unit at a time.
+    # Returns the hourly metrics of all units and {unit: "no_error" or error message}
+    selected_units = selected_units or units
+    workers = workers or os.cpu_count() or 1
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    selected_dates = pd.date_range(date_from, date_to)
+    last_disclosed = pd.Timestamp.today().normalize() - pd.to_timedelta(offer_disclosure_days, unit='d')
+    if len(selected_dates) and selected_dates.max() > last_disclosed:
+        logger.warning("Offers after %s are not published yet, backtesting up to that date", last_disclosed.strftime('%Y-%m-%d'))
+        selected_dates = selected_dates[selected_dates <= last_disclosed]
+    if not len(selected_dates):
+        return pd.DataFrame(columns=['unit', 'deliveryDate', 'hourEnding'] + backtest_metric_cols), \
+            {unit: "Error: No delivery dates with published offers in the requested range." for unit in selected_units}
+
+    try:
+        market_features = build_backtest_market_features(selected_dates)
+    except Exception as e:
+        logger.exception("Error building backtest market features: %s", e)
+        return pd.DataFrame(columns=['unit', 'deliveryDate', 'hourEnding'] + backtest_metric_cols), \
+            {unit: f"Error: {e}" for unit in selected_units}
+
+    frames = []
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for unit in selected_units:
+            if unit not in model_keys_by_unit:
+                results[unit] = f"Error: No model found for unit {unit}."
+                continue
+            futures[pool.submit(backtest_unit, unit, selected_dates, market_features, num_threads)] = unit
+
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                frames.append(future.result())
+                results[unit] = "no_error"
+            except Exception as e:
+                results[unit] = f"Error: {e}"
+            logger.info("%s: %s", unit, results[unit])
+
+    if not frames:
+        return pd.DataFrame(columns=['unit', 'deliveryDate', 'hourEnding'] + backtest_metric_cols), results
+    metrics_df = pd.concat(frames).sort_values(['unit', 'deliveryDate', 'hourEnding'], ignore_index=True)
+    metrics_df['unit'] = metrics_df['unit'].astype('category')
+    return metrics_df, results
+
+
+def summarize_backtest(metrics_df):
+    # Mean of each metric per unit over the hours with a published offer, plus an all-units row
+    scored = metrics_df.dropna(subset=['curve_mae'])
+    summary = scored.groupby('unit', observed=True)[backtest_metric_cols].mean()
+    summary['hours'] = scored.groupby('unit', observed=True).size()
+    summary.loc['all units'] = [*scored[backtest_metric_cols].mean(), len(scored)]
+    summary['hours'] = summary['hours'].astype(int)
+    return summary
+
+
+# Scattergl draws the hourly curves with WebGL instead of SVG
+plot_trace_type = 'scattergl' if os.getenv("PLOT_WEBGL", "").lower() in ("1", "true", "yes") else 'scatter'
+plot_rows, plot_cols = 4, 6
+plot_axis_style = {'gridcolor': 'white', 'zerolinecolor': 'white'}
+
+
+def subplot_domains(n, spacing):
+    # [start, end] paper coordinates of n equal cells, as make_subplots lays them out
+    size = (1 - spacing * (n - 1)) / n
+    return [[i * (size + spacing), i * (size + spacing) + size] for i in range(n)]
+
+
+def offer_curve_figure(title, curves):
+    # 4x6 grid of hourly offer curves; every (name, predictions_df, trace style) in `curves` is overlaid
+    # in each hour. Built directly as a figure dict in one pass over the prediction arrays, with fixed
+    # axis domains, so there are no layout passes or template to ship
+    arrays = [
+        (name, np.round(predictions_df[offer_mw_cols].to_numpy(dtype=float), 2), np.round(predictions_df[offer_price_cols].to_numpy(dtype=float), 2), style)
+        for name, predictions_df, style in curves
+    ]
+    x_domains = subplot_domains(plot_cols, 0.2 / plot_cols)
+    y_domains = subplot_domains(plot_rows, 0.5 / plot_rows)[::-1]  # first row on top
+
+    data = []
+    layout = {
+        'height': 800,
+        'width': 1200,
+        'title': {'text': title},
+        'showlegend': True,
+        'plot_bgcolor': '#E5ECF6',
+        'annotations': [],
+    }
+    for i in range(plot_rows * plot_cols):
+        row, col = divmod(i, plot_cols)
+        axis = '' if i == 0 else str(i + 1)
+        for name, supply, prices, style in arrays:
+            if i < len(supply):
+                data.append({
+                    'type': plot_trace_type, 'x': supply[i].tolist(), 'y': prices[i].tolist(),
+                    'xaxis': f'x{axis}', 'yaxis': f'y{axis}', 'name': name, 'legendgroup': name, 'showlegend': i == 0,
+                    **style,
+                })
+        layout[f'xaxis{axis}'] = {'domain': x_domains[col], 'anchor': f'y{axis}', **plot_axis_style}
+        layout[f'yaxis{axis}'] = {'domain': y_domains[row], 'anchor': f'x{axis}', **plot_axis_style}
+        layout['annotations'].append({
+            'text': f'Hour {i + 1}', 'font': {'size': 16}, 'showarrow': False,
+            'x': sum(x_domains[col]) / 2, 'y': y_domains[row][1], 'xref': 'paper', 'yref': 'paper',
+            'xanchor': 'center', 'yanchor': 'bottom',
+        })
+
+    # Common axis titles, under the middle of the bottom row and beside the second row
+    layout['xaxis21']['title'] = {'text': "Offer MW"}
+    layout['yaxis7']['title'] = {'text': "Offer Price in $/MW"}
+    return {'data': data, 'layout': layout}
+
+
+@timed_stage('plot')
 def plot_forecasts(selected_unit, selected_date, predictions_df, resource_type, qse):
     try:
         if predictions_df.empty:
             raise ValueError("Predictions DataFrame is empty.")
-        
-        fig = make_subplots(rows=4, cols=6, shared_xaxes=False, shared_yaxes=False,
-                            subplot_titles=[f'Hour {i+1}' for i in range(24)])
-        
-        for i, (_, row_data) in enumerate(predictions_df.iterrows()):
-            row = i // 6 + 1
-            col = i % 6 + 1
-            predicted_prices = row_data[offer_price_cols].values
-            predicted_supply = row_data[offer_mw_cols].values
-            fig.add_trace(go.Scatter(x=predicted_supply, y=predicted_prices,
-                                     mode='lines+markers', name='Predicted Offer',
-                                     marker=dict(symbol='x', color='red'),
-                                     line=dict(dash='dash', color='red'), showlegend=(i == 0)),
-                          row=row, col=col)
-            # # Update x-axis visibility for the last row
-            # for col in range(1, 7):
-            #     fig.update_xaxes(visible=True, title_text="Offer MW", row=4, col=col)
-
-            # # Update y-axis visibility for the first column
-            # for row in range(1, 5):
-            #     fig.update_yaxes(visible=True, title_text="Offer Price in $/MW", row=row, col=1)
-
-            fig.update_xaxes(title_text="Offer MW", row=4, col=3)  # Common x-axis title
-            fig.update_yaxes(title_text="Offer Price in $/MW", row=2, col=1)  # Common y-axis title
-
-            fig.update_layout(height=800, width=1200, title_text=f'Predicted Offer Curve of Unit {selected_unit} on {selected_date}, Resource Type: {resource_type}, QSE: {qse}',
-                          showlegend=True)
-            
 
+        style = {'mode': 'lines+markers', 'marker': {'symbol': 'x', 'color': 'red'}, 'line': {'dash': 'dash', 'color': 'red'}}
+        fig = offer_curve_figure(
+            f'Predicted Offer Curve of Unit {selected_unit} on {selected_date}, Resource Type: {resource_type}, QSE: {qse}',
+            [('Predicted Offer', predictions_df, style)],
+        )
         return fig, "no_error"
     except ValueError as ve:
-        print(f"ValueError: {ve}")
+        logger.error("ValueError: %s", ve)
+        count_metric('stage_errors_total', (('stage', 'plot'), ('type', 'ValueError')))
         return go.Figure(), f"Error: {ve}"  # Return empty figure and error message
     except Exception as e:
-        print(f"An error occurred in plot_forecasts: {e}")
+        logger.exception("An error occurred in plot_forecasts: %s", e)
+        count_metric('stage_errors_total', (('stage', 'plot'), ('type', type(e).__name__)))
         return go.Figure(), f"Error: {e}"  # Return empty figure and error message
 
-# Initialize the main Dash app
-app = dash.Dash(__name__)
-server = app.server
 
-# Layout with dropdowns for filtering
-app.layout = html.Div([
-    html.H1("Forecasts", style={'text-align': 'left', 'margin': '10px 0'}),
-    html.Div([
+def figure_cache_key(selected_unit, selected_date):
+    return ('figure', selected_unit, selected_date, model_version, plot_trace_type)
+
+
+def get_cached_figure(selected_unit, selected_date, progress=None):
+    # The figure is built once per forecast and cached next to it
+    key = figure_cache_key(selected_unit, selected_date)
+    fig = forecast_cache.get(key)
+    count_metric('cache_requests_total', (('cache', 'figure'), ('result', 'miss' if fig is None else 'hit')))
+    if fig is not None:
+        return fig, "no_error"
+
+    predictions_df, qse, resource_type, error_message = get_cached_predictions(selected_unit, selected_date, progress=progress)
+    if error_message != "no_error":
+        return go.Figure(), error_message
+
+    if progress is not None:
+        progress("Plotting the forecast...")
+    fig, error_message = plot_forecasts(selected_unit, selected_date, predictions_df, resource_type, qse)
+    if error_message == "no_error":
+        forecast_cache.set(key, fig, expire=forecast_cache_ttl)
+    return fig, error_message
+
+
+# Upper bound on unit-dates per comparison, to keep the figure (24 traces each) drawable
+compare_max_forecasts = int(os.getenv("COMPARE_MAX_FORECASTS", 40))
+
+
+def read_cached_batch(pairs):
+    # Cached forecasts among (unit, date) pairs as {(unit, date): get_predictions result}, and the pairs not cached
+    results = {}
+    missing = []
+    for pair in pairs:
+        cached = forecast_cache.get(forecast_cache_key(*pair))
+        if cached is None:
+            missing.append(pair)
+        else:
+            predictions_df, qse, r_type = cached
+            results[pair] = (predictions_df.copy(), qse, r_type, "no_error")
+    count_metric('cache_requests_total', (('cache', 'forecast'), ('result', 'hit')), len(pairs) - len(missing))
+    count_metric('cache_requests_total', (('cache', 'forecast'), ('result', 'miss')), len(missing))
+    return results, missing
+
+
+def score_batch(pairs):
+    # Score pairs together with predict_batch on shared market history and cache the successful ones
+    results = predict_batch(pairs)
+    for pair, result in results.items():
+        if result[3] == "no_error":
+            forecast_cache.set(forecast_cache_key(*pair), result[:3], expire=forecast_cache_ttl)
+    return results
+
+
+def get_cached_batch(pairs, progress=None):
+    # Forecasts for many (unit, date) pairs: cached ones are read, the rest are scored together
+    # and cached. Returns {(unit, date): get_predictions result}
+    results, missing = read_cached_batch(pairs)
+    if missing:
+        if progress is not None:
+            progress(f"Forecasting {len(missing)} of {len(pairs)} unit-dates...")
+        results.update(score_batch(missing))
+    return results
+
+
+@timed_stage('plot_comparison')
+def plot_comparison(results):
+    # Overlay every successful forecast in `results`, one colour per unit-date
+    curves = []
+    for (unit, date), (predictions_df, _, _, error_message) in results.items():
+        if error_message == "no_error":
+            color = DEFAULT_PLOTLY_COLORS[len(curves) % len(DEFAULT_PLOTLY_COLORS)]
+            style = {'mode': 'lines+markers', 'marker': {'size': 4, 'color': color}, 'line': {'width': 1.5, 'color': color}}
+            curves.append((f'{unit} {date}', predictions_df, style))
+    if not curves:
+        return go.Figure()
+
+    units_compared = sorted({unit for unit, _ in results})
+    dates_compared = sorted({date for _, date in results})
+    date_text = dates_compared[0] if len(dates_compared) == 1 else f'{dates_compared[0]} to {dates_compared[-1]}'
+    return offer_curve_figure(f'Predicted Offer Curves of {len(units_compared)} Units, {date_text}', curves)
+
+def forecast_table(results):
+    # One row per unit and hour of the successful forecasts in `results` ({(unit, date): get_predictions result}),
+    # with unit, QSE and resource type as categorical columns
+    scored = [(pair, result) for pair, result in results.items() if result[3] == "no_error"]
+    counts = [len(result[0]) for _, result in scored]
+    values = np.vstack([result[0][target_cols].to_numpy(dtype='float32') for _, result in scored] or [np.empty((0, len(target_cols)), dtype='float32')])
+
+    table = pd.DataFrame({
+        'unit': pd.Categorical(np.repeat([unit for (unit, _), _ in scored], counts)),
+        'qse': pd.Categorical(np.repeat([str(result[1]) for _, result in scored], counts)),
+        'resourceType': pd.Categorical(np.repeat([str(result[2]) for _, result in scored], counts)),
+        'deliveryDate': np.repeat(pd.to_datetime([date for (_, date), _ in scored]), counts),
+        'hourEnding': np.concatenate([np.arange(1, n + 1, dtype='int8') for n in counts] or [np.empty(0, dtype='int8')]),
+    })
+    return pd.concat([table, pd.DataFrame(values, columns=target_cols)], axis=1)
+
+
+def arrow_ipc_bytes(table, stream=True):
+    # Arrow IPC stream (or random-access file) of a DataFrame; categorical columns become dictionary-encoded
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with (pa.ipc.new_stream if stream else pa.ipc.new_file)(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def parquet_bytes(table):
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(table, preserve_index=False), sink, compression='zstd')
+    return sink.getvalue().to_pybytes()
+
+
+# Download and export formats: file extension and writer for a forecast_table
+export_formats = {
+    'csv': ('csv', lambda table: table.to_csv(index=False, date_format='%Y-%m-%d').encode()),
+    'parquet': ('parquet', parquet_bytes),
+    'arrow': ('arrow', lambda table: arrow_ipc_bytes(table, stream=False)),
+}
+
+
+api_formats = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# Forecasts one API request may score itself; larger requests must be precomputed first
+api_max_compute = int(os.getenv("API_MAX_COMPUTE", 4))
+api_gzip_min_bytes = int(os.getenv("API_GZIP_MIN_BYTES", 1024))
+# Rendered responses are kept per worker for a short while, so polling clients skip the cache reads
+api_response_ttl = int(os.getenv("API_RESPONSE_TTL", 60))
+api_responses = OrderedDict()
+api_responses_lock = threading.Lock()
+
+
+def forecasts_etag(selected_date, fmt, results):
+    # Changes whenever any served curve, error or the model bundle does
+    digest = hashlib.sha1(f'{model_version}|{selected_date}|{fmt}'.encode())
+    for (unit, _), (predictions_df, qse, r_type, error_message) in results.items():
+        digest.update(f'|{unit}|{qse}|{r_type}|{error_message}|'.encode())
+        if error_message == "no_error":
+            digest.update(predictions_df[target_cols].to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def render_forecasts(selected_date, fmt, results):
+    if fmt == 'csv':
+        return forecast_table(results).to_csv(index=False, date_format='%Y-%m-%d', float_format='%.3f').encode()
+    if fmt == 'arrow':
+        return arrow_ipc_bytes(forecast_table(results))
+    if fmt == 'parquet':
+        return parquet_bytes(forecast_table(results))
+
+    # JSON: per unit, the 24 x 10 price and MW steps
+    forecasts = []
+    errors = {}
+    for (unit, _), (predictions_df, qse, r_type, error_message) in results.items():
+        if error_message != "no_error":
+            errors[unit] = error_message
+            continue
+        forecasts.append({
+            'unit': unit,
+            'qse': str(qse),
+            'resourceType': str(r_type),
+            'hourEnding': list(range(1, len(predictions_df) + 1)),
+            'price': predictions_df[offer_price_cols].to_numpy().round(3).tolist(),
+            'mw': predictions_df[offer_mw_cols].to_numpy().round(3).tolist(),
+        })
+    body = {'date': selected_date, 'modelVersion': model_version, 'forecasts': forecasts, 'errors': errors}
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def api_error(status, fmt, message):
+    count_metric('api_requests_total', (('format', fmt), ('status', str(status))))
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+def build_forecasts_response(selected_date, selected_units, fmt):
+    # (expiry, ETag, body, gzipped body or None, failed units) for a request, or an error response
+    pairs = [(unit, selected_date) for unit in selected_units]
+    results, missing = read_cached_batch(pairs)
+    if len(missing) > api_max_compute:
+        return api_error(503, fmt, f"{len(missing)} of {len(pairs)} forecasts for {selected_date} are not precomputed yet.")
+    if missing:
+        results.update(score_batch(missing))
+    results = {pair: results[pair] for pair in pairs}
+    if all(result[3] != "no_error" for result in results.values()):
+        return api_error(502, fmt, "; ".join(f"{unit}: {result[3]}" for (unit, _), result in results.items()))
+
+    body = render_forecasts(selected_date, fmt, results)
+    # Parquet pages are already compressed
+    gzipped_body = gzip.compress(body, compresslevel=5) if len(body) >= api_gzip_min_bytes and fmt != 'parquet' else None
+    failed = [unit for (unit, _), result in results.items() if result[3] != "no_error"]
+    return time.time() + api_response_ttl, forecasts_etag(selected_date, fmt, results), body, gzipped_body, failed
+
+
+@timed_stage('api_forecasts')
+def forecasts_endpoint():
+    # GET /api/forecasts?date=YYYY-MM-DD&unit=A&unit=B (or unit=A,B)&format=json|csv|arrow|parquet
+    # Defaults to tomorrow and every unit; the format can also come from the Accept header
+    fmt = request.args.get('format') or request.accept_mimetypes.best_match(list(api_formats.values()), default=api_formats['json'])
+    fmt = {mimetype: name for name, mimetype in api_formats.items()}.get(fmt, fmt)
+    if fmt not in api_formats:
+        return api_error(400, 'unknown', f"Unknown format {fmt}, expected one of {', '.join(api_formats)}.")
+
+    selected_date = request.args.get('date', get_tomorrow_date())
+    try:
+        selected_date = normalize_date(selected_date)
+    except ValueError:
+        return api_error(400, fmt, f"Invalid date {selected_date}, expected YYYY-MM-DD.")
+
+    selected_units = list(dict.fromkeys(unit for value in request.args.getlist('unit') for unit in value.split(',') if unit)) or units
+    unknown = [unit for unit in selected_units if unit not in model_keys_by_unit]
+    if unknown:
+        return api_error(404, fmt, f"No model found for units: {', '.join(unknown)}.")
+
+    key = (selected_date, tuple(selected_units), fmt)
+    now = time.time()
+    with api_responses_lock:
+        cached = api_responses.get(key)
+    if cached is None or cached[0] <= now:
+        cached = build_forecasts_response(selected_date, selected_units, fmt)
+        if isinstance(cached, Response):
+            return cached
+        with api_responses_lock:
+            api_responses[key] = cached
+            api_responses.move_to_end(key)
+            while len(api_responses) > 32:
+                api_responses.popitem(last=False)
+    _, etag, body, gzipped_body, failed = cached
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif gzipped_body is not None and 'gzip' in request.accept_encodings:
+        response = Response(gzipped_body, mimetype=api_formats[fmt])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype=api_formats[fmt])
+    if failed and fmt != 'json':
+        # JSON lists the errors in the body; the tabular formats only carry the successful units
+        response.headers['X-Forecast-Errors'] = ','.join(failed)
+    # Weak, so the gzipped and identity bodies share one validator
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    count_metric('api_requests_total', (('format', fmt), ('status', str(response.status_code))))
+    return response
+
+
+# Layout with dropdowns for filtering; served per page load so the date options roll over at midnight
+def serve_layout():
+    tomorrow_date = get_tomorrow_date()
+    return html.Div([
+        html.H1("Forecasts", style={'text-align': 'left', 'margin': '10px 0'}),
         html.Div([
-            html.Label("Unit:", style={'font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='unit_dropdown',
-                options=[{'label': unit, 'value': unit} for unit in units],
-                placeholder="Select Unit",
-                style={'width': '100%'}
-            ),
-        ], style={'margin': '10px', 'width': '25%'}),
+            html.Div([
+                html.Label("Unit:", style={'font-weight': 'bold'}),
+                dcc.Dropdown(
+                    id='unit_dropdown',
+                    options=[{'label': unit, 'value': unit} for unit in units],
+                    placeholder="Select Unit",
+                    style={'width': '100%'}
+                ),
+            ], style={'margin': '10px', 'width': '25%'}),
+            html.Div([
+                html.Label("Date:", style={'font-weight': 'bold'}),
+                dcc.Dropdown(
+                    id='date_dropdown',
+                    options=[{'label': tomorrow_date, 'value': tomorrow_date}],
+                    placeholder="Select Date",
+                    style={'width': '100%'}
+                ),
+            ], style={'margin': '10px', 'width': '25%'}),
+        ], style={'display': 'flex', 'flex-wrap': 'wrap'}),
         html.Div([
-            html.Label("Date:", style={'font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='date_dropdown',
-                options=[{'label': tomorrow_date, 'value': tomorrow_date}],
-                placeholder="Select Date",
-                style={'width': '100%'}
+            dcc.Graph(id='graph-placeholder', style={'width': '100%'}),
+            html.Div(id='forecast-progress', style={'display': 'none'}),  # Pipeline stage while a forecast runs
+            html.Div(id='error-message', style={'color': 'red', 'margin-top': '20px'}),  # Error message display
+            html.Button("Download Predictions", id='download-button', n_clicks=0, style={'margin-top': '20px'}),
+            # Every unit's forecast for the selected date in one file
+            html.Button("Download All Units", id='download-all-button', n_clicks=0, style={'margin': '20px 0 0 10px'}),
+            dcc.RadioItems(
+                id='download-format',
+                options=[{'label': 'CSV', 'value': 'csv'}, {'label': 'Parquet', 'value': 'parquet'}, {'label': 'Arrow', 'value': 'arrow'}],
+                value='csv',
+                inline=True,
+                style={'margin-top': '10px'}
             ),
-        ], style={'margin': '10px', 'width': '25%'}),
-    ], style={'display': 'flex', 'flex-wrap': 'wrap'}),
-    html.Div([
-        dcc.Graph(id='graph-placeholder', style={'width': '100%'}),
-        html.Div(id='error-message', style={'color': 'red', 'margin-top': '20px'}),  # Error message display
-        html.Button("Download Predictions", id='download-button', n_clicks=0, style={'margin-top': '20px'}),
-        dcc.Download(id='download-predictions')  # Component to handle file download
-    ], style={'margin': '20px'}),
-])
+            html.Div(id='download-all-progress', style={'display': 'none'}),
+            dcc.Download(id='download-predictions'),  # Component to handle file download
+            dcc.Download(id='download-all')
+        ], style={'margin': '20px'}),
+        # Comparison of several units over a range of (historical) delivery dates, forecast in one batch
+        html.H2("Compare", style={'text-align': 'left', 'margin': '10px 0'}),
+        html.Div([
+            html.Div([
+                html.Label("Units:", style={'font-weight': 'bold'}),
+                dcc.Dropdown(
+                    id='compare_units_dropdown',
+                    options=[{'label': unit, 'value': unit} for unit in units],
+                    placeholder="Select Units",
+                    multi=True,
+                    style={'width': '100%'}
+                ),
+            ], style={'margin': '10px', 'width': '40%'}),
+            html.Div([
+                html.Label("Delivery dates:", style={'font-weight': 'bold'}),
+                dcc.DatePickerRange(
+                    id='compare_dates',
+                    max_date_allowed=tomorrow_date,
+                    end_date=tomorrow_date,
+                    display_format='YYYY-MM-DD',
+                ),
+            ], style={'margin': '10px'}),
+            html.Button("Compare", id='compare-button', n_clicks=0, style={'margin': '10px', 'align-self': 'flex-end'}),
+        ], style={'display': 'flex', 'flex-wrap': 'wrap'}),
+        html.Div([
+            dcc.Graph(id='compare-graph', style={'width': '100%'}),
+            html.Div(id='compare-progress', style={'display': 'none'}),
+            html.Div(id='compare-error', style={'color': 'red', 'margin-top': '20px'}),
+        ], style={'margin': '20px'}),
+    ])
 #     html.Div([
 #         dcc.Graph(id='graph-placeholder', style={'width': '100%'}),
 #         html.Div(id='error-message', style={'color': 'red', 'margin-top': '20px'})  # Error message display
 #     ], style={'margin': '20px'}),
 # ])
 
-# Callback to update the selected graph type and render the appropriate graph
-@app.callback(
-    [Output('graph-placeholder', 'figure'),
-     Output('error-message', 'children')],  # Output for error message
-    [Input('unit_dropdown', 'value'),
-     Input('date_dropdown', 'value')]
-)
-def update_graph(selected_unit, selected_date):
+# Callback to update the selected graph type and render the appropriate graph.
+# Runs as a background job; set_progress reports the pipeline stage to the page while it polls
+def update_graph(set_progress, selected_unit, selected_date):
     if selected_unit is None or selected_date is None:
         return go.Figure(), "Please select both Unit and Date."
     
-    unit_forecast_df, qse, resource_type, error_message = get_predictions(selected_unit, selected_date)
-    
-    if error_message == 'no_error':
-        fig, error_message = plot_forecasts(selected_unit, selected_date, unit_forecast_df, resource_type, qse)
-        return fig, error_message
-    
-    else:
-        return go.Figure(), error_message
+    fig, error_message = get_cached_figure(selected_unit, selected_date, progress=set_progress)
+    return fig, error_message
+
+# Callback to forecast and overlay several units over a date range; a background job like update_graph
+def update_comparison(set_progress, n_clicks, selected_units, start_date, end_date):
+    if not selected_units or start_date is None:
+        return go.Figure(), "Please select Units and Dates."
+
+    dates = pd.date_range(start_date[:10], (end_date or start_date)[:10]).strftime('%Y-%m-%d')
+    pairs = [(unit, date) for date in dates for unit in selected_units]
+    if not pairs:
+        return go.Figure(), "The end date is before the start date."
+    if len(pairs) > compare_max_forecasts:
+        return go.Figure(), f"{len(pairs)} unit-dates selected, compare at most {compare_max_forecasts} at once."
+
+    results = get_cached_batch(pairs, progress=set_progress)
+    set_progress("Plotting the comparison...")
+    errors = [f"{unit} on {date}: {result[3]}" for (unit, date), result in results.items() if result[3] != "no_error"]
+    return plot_comparison(results), "; ".join(errors)
 
 # Callback to handle file download
-@app.callback(
-    Output('download-predictions', 'data'),
-    Input('download-button', 'n_clicks'),
-    [Input('unit_dropdown', 'value'),
-     Input('date_dropdown', 'value')]
-)
-def download_predictions(n_clicks, selected_unit, selected_date):
+def download_predictions(n_clicks, selected_unit, selected_date, download_format='csv'):
     if n_clicks > 0:
         if selected_unit is None or selected_date is None:
             return None  # Do nothing if inputs are not selected
         
-        unit_forecast_df, qse, resource_type, error_message = get_predictions(selected_unit, selected_date)
+        unit_forecast_df, qse, resource_type, error_message = get_cached_predictions(selected_unit, selected_date)
         
         if error_message == 'no_error':
+            filename = f"{selected_date}_{selected_unit}_{resource_type}_{qse}_predictions"
+            if download_format in ('parquet', 'arrow'):
+                extension, write = export_formats[download_format]
+                table = forecast_table({(selected_unit, selected_date): (unit_forecast_df, qse, resource_type, error_message)})
+                return dcc.send_bytes(write(table), f"{filename}.{extension}")
             unit_forecast_df['hour'] = list(range(1, 25))
-            filename = f"{selected_date}_{selected_unit}_{resource_type}_{qse}_predictions.csv"
-            return dcc.send_data_frame(unit_forecast_df.to_csv, filename, index=False)
+            return dcc.send_data_frame(unit_forecast_df.to_csv, f"{filename}.csv", index=False)
         
     return None
 
-# Run the app
+
+def export_forecasts(selected_date, selected_units=None, export_format='parquet', progress=None):
+    # One file with every unit's forecast for a delivery date, from the forecast cache (missing
+    # forecasts are scored in one batch). Returns (file bytes, {unit: "no_error" or error message})
+    selected_units = selected_units or units
+    results = get_cached_batch([(unit, selected_date) for unit in selected_units], progress)
+    _, write = export_formats[export_format]
+    return write(forecast_table(results)), {unit: result[3] for (unit, _), result in results.items()}
+
+
+# Background job: the forecasts of units that were not precomputed may take a while
+def download_all_predictions(set_progress, n_clicks, selected_date, download_format):
+    if not n_clicks or selected_date is None:
+        return None
+    data, results = export_forecasts(selected_date, export_format=download_format, progress=set_progress)
+    failed = [unit for unit, message in results.items() if message != "no_error"]
+    if len(failed) == len(results):
+        return None
+    if failed:
+        logger.warning("Fleet download for %s is missing %d units: %s", selected_date, len(failed), ", ".join(failed))
+    extension, _ = export_formats[download_format]
+    return dcc.send_bytes(data, f"{selected_date}_all_units_predictions.{extension}")
+
+
+def create_app():
+    # Only builds the Dash app; the model registry and caches above are module state,
+    # loaded once in the gunicorn master under --preload and shared by forked workers
+    # Forecasts run in background processes so a slow pipeline doesn't hold a gunicorn worker
+    background_callback_manager = dash.DiskcacheManager(diskcache.Cache(os.getenv("JOB_CACHE_DIR", os.path.join("cache", "jobs"))))
+    dash_app = dash.Dash(__name__, background_callback_manager=background_callback_manager)
+    dash_app.layout = serve_layout
+
+    dash_app.callback(
+        [Output('graph-placeholder', 'figure'),
+         Output('error-message', 'children')],  # Output for error message
+        [Input('unit_dropdown', 'value'),
+         Input('date_dropdown', 'value')],
+        background=True,
+        progress=Output('forecast-progress', 'children'),
+        running=[
+            (Output('forecast-progress', 'style'), {'margin-top': '20px'}, {'display': 'none'}),
+            (Output('download-button', 'disabled'), True, False),
+        ],
+    )(update_graph)
+
+    dash_app.callback(
+        [Output('compare-graph', 'figure'),
+         Output('compare-error', 'children')],
+        Input('compare-button', 'n_clicks'),
+        [State('compare_units_dropdown', 'value'),
+         State('compare_dates', 'start_date'),
+         State('compare_dates', 'end_date')],
+        background=True,
+        progress=Output('compare-progress', 'children'),
+        running=[
+            (Output('compare-progress', 'style'), {'margin-top': '20px'}, {'display': 'none'}),
+            (Output('compare-button', 'disabled'), True, False),
+        ],
+        prevent_initial_call=True,
+    )(update_comparison)
+
+    dash_app.callback(
+        Output('download-predictions', 'data'),
+        Input('download-button', 'n_clicks'),
+        [State('unit_dropdown', 'value'),
+         State('date_dropdown', 'value'),
+         State('download-format', 'value')]
+    )(download_predictions)
+
+    dash_app.callback(
+        Output('download-all', 'data'),
+        Input('download-all-button', 'n_clicks'),
+        [State('date_dropdown', 'value'),
+         State('download-format', 'value')],
+        background=True,
+        progress=Output('download-all-progress', 'children'),
+        running=[
+            (Output('download-all-progress', 'style'), {'margin-top': '20px'}, {'display': 'none'}),
+            (Output('download-all-button', 'disabled'), True, False),
+        ],
+        prevent_initial_call=True,
+    )(download_all_predictions)
+
+    # Prometheus scrape target
+    dash_app.server.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+    dash_app.server.add_url_rule('/api/forecasts', 'api_forecasts', forecasts_endpoint)
+
+    return dash_app
+
+
+# Initialize the main Dash app
+app = create_app()
+server = app.server
+
+# Run the app, precompute forecasts with `python app.py precompute --date YYYY-MM-DD`,
+# backtest with `python app.py backtest --from YYYY-MM-DD --to YYYY-MM-DD`,
+# or export a delivery date with `python app.py export --date YYYY-MM-DD --output forecasts.parquet`
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    parser = argparse.ArgumentParser(description="ERCOT day-ahead offer curve forecasts")
+    subparsers = parser.add_subparsers(dest='command')
+    precompute_parser = subparsers.add_parser('precompute', help="Score all units for a delivery date into the forecast cache")
+    precompute_parser.add_argument('--date', type=normalize_date, default=get_tomorrow_date(), help="Delivery date (YYYY-MM-DD), defaults to tomorrow")
+    precompute_parser.add_argument('--units', nargs='+', help="Units to score, defaults to every unit with a model")
+    precompute_parser.add_argument('--workers', type=int, help="Scoring processes, defaults to the CPU count")
+    backtest_parser = subparsers.add_parser('backtest', help="Score past delivery dates and compare with the offers actually submitted")
+    backtest_parser.add_argument('--from', dest='date_from', type=normalize_date, required=True, help="First delivery date (YYYY-MM-DD)")
+    backtest_parser.add_argument('--to', dest='date_to', type=normalize_date, required=True, help="Last delivery date (YYYY-MM-DD), at most 60 days ago")
+    backtest_parser.add_argument('--units', nargs='+', help="Units to backtest, defaults to every unit with a model")
+    backtest_parser.add_argument('--workers', type=int, help="Backtest processes, defaults to the CPU count")
+    backtest_parser.add_argument('--output', help="Write the hourly metrics to this .parquet or .csv file")
+    export_parser = subparsers.add_parser('export', help="Write every unit's forecast for a delivery date to one file")
+    export_parser.add_argument('--date', type=normalize_date, default=get_tomorrow_date(), help="Delivery date (YYYY-MM-DD), defaults to tomorrow")
+    export_parser.add_argument('--units', nargs='+', help="Units to export, defaults to every unit with a model")
+    export_parser.add_argument('--format', choices=sorted(export_formats), help="File format, defaults to the output extension or parquet")
+    export_parser.add_argument('--output', required=True, help="File to write, e.g. forecasts.parquet")
+    args = parser.parse_args()
+
+    if args.command == 'precompute':
+        results = precompute_forecasts(args.date, args.units, args.workers)
+        failed = [unit for unit, message in results.items() if message != "no_error"]
+        print(f"Precomputed {len(results) - len(failed)} of {len(results)} forecasts for {args.date}")
+        sys.exit(1 if failed else 0)
+    elif args.command == 'backtest':
+        metrics_df, results = run_backtest(args.date_from, args.date_to, args.units, args.workers)
+        failed = [unit for unit, message in results.items() if message != "no_error"]
+        if args.output:
+            if args.output.endswith('.parquet'):
+                metrics_df.to_parquet(args.output, index=False)
+            else:
+                metrics_df.to_csv(args.output, index=False)
+        if len(metrics_df):
+            print(summarize_backtest(metrics_df).to_string(float_format='%.2f'))
+        print(f"Backtested {len(results) - len(failed)} of {len(results)} units from {args.date_from} to {args.date_to}")
+        sys.exit(1 if failed else 0)
+    elif args.command == 'export':
+        export_format = args.format or os.path.splitext(args.output)[1].lstrip('.')
+        if export_format not in export_formats:
+            export_format = 'parquet'
+        data, results = export_forecasts(args.date, args.units, export_format)
+        failed = [unit for unit, message in results.items() if message != "no_error"]
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"Exported {len(results) - len(failed)} of {len(results)} forecasts for {args.date} to {args.output}")
+        sys.exit(1 if failed else 0)
+    else:
+        app.run(debug=True)
 
 
 # # Callback to update the selected graph type and render the appropriate graph
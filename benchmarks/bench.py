@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmark_dir)
+sys.path.insert(0, benchmark_dir)
+sys.path.insert(0, repo_dir)
+
+from stub_server import ErcotStub, FixtureGridStatusClient, start_stub_server
+
+
+def configure_env(work_dir, bundle_path, model_dir, ercot_url=None):
+    # Everything app.py reads at import time: an offline model bundle and private cache dirs
+    os.environ.update({
+        "MODEL_OFFLINE": "1",
+        "MODEL_BUNDLE_PATH": bundle_path,
+        "MODEL_DIR": model_dir,
+        "HISTORY_CACHE_DIR": os.path.join(work_dir, "cache", "history"),
+        "ROLLING_CACHE_DIR": os.path.join(work_dir, "cache", "rolling"),
+        "FORECAST_CACHE_DIR": os.path.join(work_dir, "cache", "forecasts"),
+        "METRICS_DIR": os.path.join(work_dir, "cache", "metrics"),
+        "JOB_CACHE_DIR": os.path.join(work_dir, "cache", "jobs"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    if ercot_url is not None:
+        os.environ.update({
+            "ERCOT_API_URL": ercot_url,
+            "ERCOT_TOKEN_URL": f"{ercot_url}/token",
+            "ERCOT_API_USERNAME": "bench",
+            "ERCOT_API_PASSWORD": "bench",
+            "ERCOT_API_KEY": "bench",
+        })
+
+
+def import_app_without_models(work_dir):
+    # app.py needs a bundle to import; an empty one is enough to read the feature layout
+    bundle_path = os.path.join(work_dir, "empty_bundle.pkl")
+    with open(bundle_path, "wb") as f:
+        pickle.dump({"models": {}}, f)
+    configure_env(work_dir, bundle_path, os.path.join(work_dir, "models_empty"))
+    import app
+    return app
+
+
+def make_model_bundle(bundle_path, n_units, work_dir):
+    # Small MultiOutputRegressor(LGBMRegressor) per unit, trained on random data with the real feature layout
+    from lightgbm import LGBMRegressor
+    from sklearn.multioutput import MultiOutputRegressor
+
+    app = import_app_without_models(work_dir)
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((256, len(app.feature_cols))), columns=app.feature_cols)
+    n_price = len(app.offer_price_cols)
+    Y = np.hstack([np.sort(rng.random((256, n_price)), axis=1) * 250, np.sort(rng.random((256, n_price)), axis=1) * 500])
+
+    models = {}
+    for i in range(n_units):
+        resource_type = ("CCGT90", "SCGT90")[i % 2]
+        key = f"{resource_type}_BENCHQSE{i % 4}_BENCH_UNIT_{i:03d}.csv"
+        models[key] = MultiOutputRegressor(LGBMRegressor(n_estimators=50, num_leaves=15, verbose=-1, random_state=i)).fit(X, Y)
+
+    with open(bundle_path, "wb") as f:
+        pickle.dump({"models": models}, f)
+
+
+def reset_caches(app, work_dir):
+    # Fresh history, rolling and forecast caches, as on a newly started host
+    cache_dir = os.path.join(work_dir, "cache", "run")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    app.rolling_store = app.RollingAggregateStore(os.path.join(cache_dir, "rolling"), {'houston': 'houston', 'henry_hub': 'price'})
+    app.history_store = app.HistoryStore(os.path.join(cache_dir, "history"), on_top_up=app.rolling_store.record)
+    app.forecast_cache.clear()
+    with app.market_contexts_lock:
+        app.market_contexts.clear()
+
+
+def timed(results, name, fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    results.setdefault(name, []).append(time.perf_counter() - start)
+    return value
+
+
+def run_scenario(app, stub, work_dir, selected_date, selected_units, history_days, repeat):
+    stub.earliest_day = (pd.to_datetime(selected_date) - pd.to_timedelta(history_days, unit='d')).strftime('%Y-%m-%d')
+    results = {}
+    no_progress = lambda message: None
+
+    for _ in range(repeat):
+        reset_caches(app, work_dir)
+        for unit in selected_units:
+            timed(results, "get_all_historical_data (cold)", app.get_all_historical_data, selected_date, unit)
+        for unit in selected_units:
+            timed(results, "get_all_historical_data (warm)", app.get_all_historical_data, selected_date, unit)
+
+        for unit in selected_units:
+            predictions_df, qse, r_type, error_message = timed(results, "get_predictions", app.get_predictions, unit, selected_date)
+            if error_message != "no_error":
+                raise RuntimeError(f"get_predictions failed for {unit}: {error_message}")
+            timed(results, "plot_forecasts", app.plot_forecasts, unit, selected_date, predictions_df, r_type, qse)
+
+        timed(results, "predict_batch", app.predict_batch, [(unit, selected_date) for unit in selected_units])
+
+        app.forecast_cache.clear()
+        for unit in selected_units:
+            timed(results, "update_graph callback (miss)", app.update_graph, no_progress, unit, selected_date)
+        for unit in selected_units:
+            timed(results, "update_graph callback (hit)", app.update_graph, no_progress, unit, selected_date)
+            timed(results, "download_predictions callback", app.download_predictions, 1, unit, selected_date)
+
+    return results
+
+
+def summarize(scenario, results):
+    rows = []
+    for name, samples in results.items():
+        samples_ms = np.array(samples) * 1000
+        rows.append({
+            **scenario,
+            "stage": name,
+            "calls": len(samples_ms),
+            "mean_ms": round(float(samples_ms.mean()), 2),
+            "p50_ms": round(float(np.percentile(samples_ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(samples_ms, 95)), 2),
+        })
+    return rows
+
+
+def print_table(rows, baseline=None):
+    baseline_p50 = {(row["units"], row["history_days"], row["stage"]): row["p50_ms"] for row in baseline or []}
+    header = f"{'units':>5} {'history':>7}  {'stage':<32} {'calls':>5} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}"
+    if baseline:
+        header += f" {'p50 vs base':>11}"
+    print(header)
+    for row in rows:
+        line = (f"{row['units']:>5} {row['history_days']:>7}  {row['stage']:<32} {row['calls']:>5} "
+                f"{row['mean_ms']:>9.2f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}")
+        base = baseline_p50.get((row["units"], row["history_days"], row["stage"]))
+        if base:
+            line += f" {row['p50_ms'] / base:>10.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the forecast pipeline against recorded upstream fixtures")
+    parser.add_argument('--units', type=int, nargs='+', default=[1, 4, 16], help="Unit counts to benchmark")
+    parser.add_argument('--history-days', type=int, nargs='+', default=[63, 123],
+                        help="Days of upstream history available before the delivery date (below 63 units have no offer history)")
+    parser.add_argument('--date', default='2024-06-01', help="Delivery date (YYYY-MM-DD); a settled past date keeps warm runs off the network")
+    parser.add_argument('--repeat', type=int, default=3, help="Cold-cache repetitions per scenario")
+    parser.add_argument('--work-dir', help="Scratch directory for the model bundle and caches, defaults to a temporary directory")
+    parser.add_argument('--json', help="Write the results to this file, e.g. to keep as a baseline")
+    parser.add_argument('--baseline', help="Results file from an earlier run to compare p50 latencies against")
+    parser.add_argument('--make-bundle', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ercot-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    warnings.simplefilter("ignore")
+
+    if args.make_bundle:
+        make_model_bundle(args.make_bundle, max(args.units), work_dir)
+        return
+
+    # The bundle is built in a child process, which imports app.py with an empty bundle first
+    n_units = max(args.units)
+    bundle_path = os.path.join(work_dir, f"bench_bundle_{n_units}.pkl")
+    if not os.path.exists(bundle_path):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--make-bundle', bundle_path,
+                        '--units', str(n_units), '--work-dir', work_dir], check=True)
+
+    stub = ErcotStub()
+    server, ercot_url = start_stub_server(stub)
+    configure_env(work_dir, bundle_path, os.path.join(work_dir, f"models_{n_units}"), ercot_url)
+    import app
+
+    app.gridstatus_client = FixtureGridStatusClient(stub)
+    for unit, key in app.model_keys_by_unit.items():
+        resource_type, qse, _ = key.split('.')[0].split('_', 2)
+        stub.units[unit] = (qse, resource_type)
+    bench_units = sorted(app.model_keys_by_unit)
+
+    rows = []
+    for history_days in args.history_days:
+        for count in args.units:
+            results = run_scenario(app, stub, work_dir, args.date, bench_units[:count], history_days, args.repeat)
+            rows.extend(summarize({"units": count, "history_days": history_days}, results))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_table(rows, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"date": args.date, "repeat": args.repeat, "results": rows}, f, indent=2)
+
+    server.shutdown()
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
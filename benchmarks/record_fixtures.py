@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from bench import import_app_without_models
+from stub_server import fixture_dir, houston_fixture, ng_fixture, offer_fixture
+
+# Re-record the upstream fixtures from the live APIs. Needs the same ERCOT_API_* and
+# GRIDSTATUS_API_KEY credentials as the app; the stub server replays one recorded day
+# (one trading week for Henry Hub) over any requested range
+
+
+def write_fixture(name, data):
+    with open(os.path.join(fixture_dir, name), "w") as f:
+        json.dump(data, f, indent=1)
+    print(f"Recorded {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record upstream responses as benchmark fixtures")
+    parser.add_argument('--date', default='2024-06-01', help="Operating/delivery day to record (YYYY-MM-DD)")
+    parser.add_argument('--unit', required=True, help="Resource name to record past offers for")
+    args = parser.parse_args()
+
+    app = import_app_without_models(tempfile.mkdtemp(prefix="ercot-record-"))
+
+    response = app.ercot_get(f"{app.ercot_api_url}/np6-346-cd/act_sys_load_by_fzn",
+                             {"operatingDayFrom": args.date, "operatingDayTo": args.date})
+    response.raise_for_status()
+    write_fixture(houston_fixture, response.json())
+
+    response = app.ercot_get(f"{app.ercot_api_url}/np3-966-er/60_dam_gen_res_data",
+                             {"deliveryDateFrom": args.date, "deliveryDateTo": args.date,
+                              "hourEndingFrom": 1, "hourEndingTo": 24, "resourceName": args.unit})
+    response.raise_for_status()
+    write_fixture(offer_fixture, response.json())
+
+    day = pd.to_datetime(args.date)
+    week_start = day - pd.to_timedelta(day.dayofweek, unit='d')
+    ng_df = app.get_gridstatus_client().get_dataset(
+        dataset="eia_henry_hub_natural_gas_spot_prices_daily",
+        start=week_start.strftime('%Y-%m-%d'),
+        end=(week_start + pd.to_timedelta(7, unit='d')).strftime('%Y-%m-%d'),
+    )
+    ng_df['period'] = pd.to_datetime(ng_df['period']).dt.strftime('%Y-%m-%d')
+    write_fixture(ng_fixture, {
+        "status_code": 200,
+        "data": ng_df[['period', 'price']].to_dict(orient='records'),
+        "meta": {"page": 1, "limit": None, "page_size": len(ng_df), "hasNextPage": False, "cursor": None},
+        "dataset_metadata": {"id": "eia_henry_hub_natural_gas_spot_prices_daily", "time_index_column": "period"},
+    })
+
+
+if __name__ == '__main__':
+    sys.exit(main())
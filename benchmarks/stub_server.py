@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+houston_fixture = "np6-346-cd_act_sys_load_by_fzn.json"
+offer_fixture = "np3-966-er_60_dam_gen_res_data.json"
+ng_fixture = "eia_henry_hub_natural_gas_spot_prices_daily.json"
+
+
+def load_fixture(name):
+    with open(os.path.join(fixture_dir, name)) as f:
+        return json.load(f)
+
+
+def day_factor(*key):
+    # Deterministic per-day variation, so repeated runs see identical data
+    rng = np.random.default_rng(zlib.crc32("|".join(map(str, key)).encode()))
+    return 1 + rng.normal(0, 0.03)
+
+
+def requested_days(day_from, day_to, earliest_day=None):
+    days = pd.date_range(day_from, day_to)
+    if earliest_day is not None:
+        days = days[days >= pd.to_datetime(earliest_day)]
+    return days.strftime('%Y-%m-%d')
+
+
+class ErcotStub:
+    # Replays the one-day ERCOT fixtures for any requested date range and unit. The fixtures keep
+    # the recorded response format, but their values are synthetic until record_fixtures.py is run.
+    # Days before earliest_day are left out to emulate shorter histories
+
+    def __init__(self, units=None, earliest_day=None):
+        self.houston = load_fixture(houston_fixture)
+        self.offers = load_fixture(offer_fixture)
+        self.units = units or {}  # unit -> (qse, resource type)
+        self.earliest_day = earliest_day
+        self.requests = 0
+
+    def houston_loads(self, params):
+        fields = [field["name"] for field in self.houston["fields"]]
+        date_pos = fields.index("operatingDay")
+        scaled_pos = [fields.index(name) for name in ("north", "south", "west", "houston", "total")]
+
+        data = []
+        for day in requested_days(params["operatingDayFrom"], params["operatingDayTo"], self.earliest_day):
+            factor = day_factor("houston", day)
+            for row in self.houston["data"]:
+                row = list(row)
+                row[date_pos] = day
+                for pos in scaled_pos:
+                    row[pos] = round(row[pos] * factor, 2)
+                data.append(row)
+        return self.report(self.houston, data, params)
+
+    def past_offers(self, params):
+        fields = [field["name"] for field in self.offers["fields"]]
+        unit = params["resourceName"]
+        qse, resource_type = self.units.get(unit, ("QSE_RECORDED", "CCGT90"))
+        substitutions = {
+            fields.index("resourceName"): unit,
+            fields.index("qseName"): qse,
+            fields.index("resourceType"): resource_type,
+        }
+        mw_pos = [pos for pos, name in enumerate(fields) if name.startswith("qseSubmittedCurveMW")]
+        price_pos = [pos for pos, name in enumerate(fields) if name.startswith("qseSubmittedCurvePrice")]
+        hour_from = int(params.get("hourEndingFrom", 1))
+        hour_to = int(params.get("hourEndingTo", 24))
+
+        data = []
+        for day in requested_days(params["deliveryDateFrom"], params["deliveryDateTo"], self.earliest_day):
+            mw_factor = day_factor("mw", unit, day)
+            price_factor = day_factor("price", unit, day)
+            for row in self.offers["data"]:
+                if not hour_from <= row[fields.index("hourEnding")] <= hour_to:
+                    continue
+                row = list(row)
+                row[fields.index("deliveryDate")] = day
+                for pos, value in substitutions.items():
+                    row[pos] = value
+                # Unused curve steps are null, as in the real report
+                for pos in mw_pos:
+                    row[pos] = None if row[pos] is None else round(row[pos] * mw_factor, 1)
+                for pos in price_pos:
+                    row[pos] = None if row[pos] is None else round(row[pos] * price_factor, 2)
+                data.append(row)
+        return self.report(self.offers, data, params)
+
+    def report(self, fixture, data, params):
+        # One page of `size` rows, like the public API
+        size = int(params.get("size", 25000))
+        page = int(params.get("page", 1))
+        return {
+            "_meta": {"totalRecords": len(data), "pageSize": size, "totalPages": max(1, -(-len(data) // size)), "currentPage": page},
+            "report": fixture["report"],
+            "fields": fixture["fields"],
+            "data": data[(page - 1) * size:page * size],
+        }
+
+    def token(self):
+        return {"access_token": "stub-access-token", "refresh_token": "stub-refresh-token", "expires_in": 3600}
+
+
+def make_handler(stub):
+    routes = {
+        "/np6-346-cd/act_sys_load_by_fzn": stub.houston_loads,
+        "/np3-966-er/60_dam_gen_res_data": stub.past_offers,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                return self.send_json(404, {"error": f"No stub for {url.path}"})
+            stub.requests += 1
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self.send_json(200, route(params))
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/token":
+                return self.send_json(404, {"error": f"No stub for {self.path}"})
+            self.send_json(200, stub.token())
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(stub, host="127.0.0.1", port=0):
+    # Serves the ERCOT routes under http://host:port and the token endpoint at /token
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+class FixtureGridStatusClient:
+    # Stands in for GridStatusClient: get_dataset replays the Henry Hub week fixture (synthetic
+    # prices until record_fixtures.py is run)
+    # over the requested range (end exclusive, trading days only)
+
+    def __init__(self, stub=None):
+        self.stub = stub
+        self.fixture = load_fixture(ng_fixture)
+
+    def get_dataset(self, dataset, start=None, end=None, **kwargs):
+        if dataset != self.fixture["dataset_metadata"]["id"]:
+            raise Exception(f"Error 404: no fixture for dataset {dataset}")
+        prices = {pd.to_datetime(record["period"]).dayofweek: record["price"] for record in self.fixture["data"]}
+        earliest_day = self.stub.earliest_day if self.stub is not None else None
+
+        days = requested_days(start, (pd.to_datetime(end) - pd.to_timedelta(1, unit='d')).strftime('%Y-%m-%d'), earliest_day)
+        records = [
+            {"period": day, "price": round(prices[pd.to_datetime(day).dayofweek] * day_factor("ng", day), 3)}
+            for day in days if pd.to_datetime(day).dayofweek in prices
+        ]
+        return pd.DataFrame(records, columns=["period", "price"])
@@ -0,0 +1,18 @@
+import gc
+import os
+
+# Serve with `gunicorn app:server`; this file is picked up from the working directory
+
+# Import app.py (model registry, caches) once in the master and fork workers from it
+preload_app = True
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collection in the workers doesn't touch (and un-share) the preloaded pages
+    gc.freeze()
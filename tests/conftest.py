@@ -0,0 +1,32 @@
+import os
+import pickle
+import sys
+import tempfile
+
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+
+@pytest.fixture(scope="session")
+def app():
+    # app.py loads its model bundle and opens its caches at import time; an empty offline
+    # bundle and private cache dirs are enough to exercise the feature builders
+    work_dir = tempfile.mkdtemp(prefix="ercot-tests-")
+    bundle_path = os.path.join(work_dir, "empty_bundle.pkl")
+    with open(bundle_path, "wb") as f:
+        pickle.dump({"models": {}}, f)
+    os.environ.update({
+        "MODEL_OFFLINE": "1",
+        "MODEL_BUNDLE_PATH": bundle_path,
+        "MODEL_DIR": os.path.join(work_dir, "models"),
+        "HISTORY_CACHE_DIR": os.path.join(work_dir, "cache", "history"),
+        "ROLLING_CACHE_DIR": os.path.join(work_dir, "cache", "rolling"),
+        "FORECAST_CACHE_DIR": os.path.join(work_dir, "cache", "forecasts"),
+        "METRICS_DIR": os.path.join(work_dir, "cache", "metrics"),
+        "JOB_CACHE_DIR": os.path.join(work_dir, "cache", "jobs"),
+        "LOG_LEVEL": "WARNING",
+    })
+    import app
+    return app
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+def make_history(seed=0):
+    # Houston load, NG price and offer history with some days and hours missing
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2024-01-01', '2024-06-01')
+    days = days[rng.random(len(days)) > 0.1]
+
+    houston = pd.DataFrame([(day, hour) for day in days for hour in range(1, 25)], columns=['operatingDay', 'hour'])
+    houston = houston[rng.random(len(houston)) > 0.05].reset_index(drop=True)
+    houston['hour'] = houston['hour'].astype('int8')
+    houston['houston'] = rng.uniform(5000, 20000, len(houston)).astype('float32')
+
+    ng = pd.DataFrame({'period': days[days.dayofweek < 5]})
+    ng['NG Price in Dollar Per MW'] = rng.uniform(10, 30, len(ng)).astype('float32')
+
+    offers = pd.DataFrame([(day, hour) for day in days for hour in range(1, 25)], columns=['deliveryDate', 'hourEnding'])
+    offers = offers[rng.random(len(offers)) > 0.05].reset_index(drop=True)
+    offers['hourEnding'] = offers['hourEnding'].astype('int8')
+    for i in range(1, 11):
+        offers[f'qseSubmittedCurvePrice{i}'] = rng.uniform(0, 200, len(offers)).astype('float32')
+        offers[f'qseSubmittedCurveMW{i}'] = rng.uniform(0, 500, len(offers)).astype('float32')
+    # Unused curve steps come back as nulls
+    offers.loc[rng.random(len(offers)) < 0.2, ['qseSubmittedCurvePrice10', 'qseSubmittedCurveMW10']] = np.nan
+    return houston, ng, offers
+
+
+def loop_lag_features(app, selected_date, houston, ng, offers):
+    # The original per (day, hour, column) filtering loop, in feature order
+    selected_date = pd.Timestamp(selected_date)
+
+    def past(day):
+        return selected_date - pd.Timedelta(days=day)
+
+    def first_or_nan(values):
+        return values[0] if len(values) else np.nan
+
+    market = []
+    for day in app.day_intervals:
+        for hour in app.hour_offsets:
+            market.append(first_or_nan(houston.loc[(houston['operatingDay'] == past(day)) & (houston['hour'] == hour), 'houston'].values))
+    houston_daily = houston.groupby('operatingDay')['houston'].mean()
+    market += [houston_daily.get(past(day), np.nan) for day in app.day_intervals + app.short_day_intervals_houston]
+    ng_daily = ng.groupby('period')['NG Price in Dollar Per MW'].mean()
+    market += [ng_daily.get(past(day), np.nan) for day in app.day_intervals + app.short_day_intervals_ng]
+
+    offer = []
+    for cols in (app.offer_price_cols, app.offer_mw_cols):
+        for day in app.day_intervals:
+            for hour in app.hour_offsets:
+                rows = offers[(offers['deliveryDate'] == past(day)) & (offers['hourEnding'] == hour)]
+                offer += [first_or_nan(rows[col].values) for col in cols]
+        for day in app.day_intervals:
+            offer += [offers.loc[offers['deliveryDate'] == past(day), col].mean() for col in cols]
+    return np.array(market, dtype=float), np.array(offer, dtype=float)
+
+
+def test_pivoted_features_match_the_filtering_loop(app):
+    houston, ng, offers = make_history()
+    n_rolling = len(app.rolling_avg_features)
+
+    for selected_date in ['2024-05-20', '2024-05-31', '2024-06-02']:
+        market_expected, offer_expected = loop_lag_features(app, selected_date, houston, ng, offers)
+
+        market = app.build_market_feature_matrix([pd.Timestamp(selected_date)], 'CCGT90', houston, ng)[0]
+        offer = app.build_offer_features(selected_date, offers)
+
+        assert len(offer) == len(app.offer_feature_cols)
+        np.testing.assert_allclose(market[:-n_rolling], market_expected, rtol=1e-6, equal_nan=True)
+        np.testing.assert_allclose(offer, offer_expected, rtol=1e-6, equal_nan=True)
@@ -0,0 +1,33 @@
+import pandas as pd
+
+
+def test_unsettled_offer_days_are_fetched_again(app, tmp_path):
+    store = app.HistoryStore(str(tmp_path), settle_days=7)
+    today = pd.Timestamp.today().normalize()
+    settled = today - pd.Timedelta(days=app.offer_disclosure_days + store.settle_days)
+    day_from = (settled - pd.Timedelta(days=5)).strftime('%Y-%m-%d')
+    day_to = (settled + pd.Timedelta(days=5)).strftime('%Y-%m-%d')
+    days = list(pd.date_range(day_from, day_to).strftime('%Y-%m-%d'))
+    unsettled = [day for day in days if day > settled.strftime('%Y-%m-%d')]
+
+    fetched = []
+
+    def fetch(run_from, run_to):
+        run = list(pd.date_range(run_from, run_to).strftime('%Y-%m-%d'))
+        fetched.extend(run)
+        return pd.DataFrame({'deliveryDate': pd.to_datetime(run), 'value': 1.0})
+
+    history = store.get('offers', 'deliveryDate', day_from, day_to, fetch, publish_lag_days=app.offer_disclosure_days)
+    assert fetched == days
+    assert len(history) == len(days)
+
+    _, covered = store._read('offers')
+    assert covered == set(days) - set(unsettled)
+
+    fetched.clear()
+    history = store.get('offers', 'deliveryDate', day_from, day_to, fetch, publish_lag_days=app.offer_disclosure_days)
+    assert unsettled and fetched == unsettled
+    assert len(history) == len(days)
+
+    _, covered = store._read('offers')
+    assert not covered & set(unsettled)
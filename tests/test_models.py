@@ -0,0 +1,18 @@
+import numpy as np
+from lightgbm import LGBMRegressor
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
+
+
+def test_predict_with_threads_keeps_the_target_shape(app):
+    rng = np.random.default_rng(0)
+    X, Y = rng.random((64, 5)), rng.random((64, 20))
+    models = [
+        MultiOutputRegressor(LGBMRegressor(n_estimators=5, verbose=-1)).fit(X, Y),
+        # Forests have estimators_ too, but one per tree rather than per target
+        RandomForestRegressor(n_estimators=5, random_state=0).fit(X, Y),
+    ]
+    for model in models:
+        predictions = app.predict_with_threads(model, X[:24], num_threads=2)
+        assert predictions.shape == (24, 20)
+        np.testing.assert_allclose(predictions, model.predict(X[:24]))